@@ -0,0 +1,66 @@
+import threading
+import time
+import os
+
+# Local resources (NLTK data, model weights) used by the agents, plus an
+# offline mode for nodes without internet access. With AGENT_OFFLINE=1
+# nothing is downloaded: NLTK data and models must already be present in
+# AGENT_VENDOR_DIR (nltk_data/, models/<name>/, torch/) or the usual caches.
+# Online, missing NLTK data is downloaded to NLTK's default directory.
+
+AGENT_DIR = os.path.dirname(os.path.abspath(__file__))
+OFFLINE = os.environ.get("AGENT_OFFLINE", "0") == "1"
+VENDOR_DIR = os.environ.get("AGENT_VENDOR_DIR", os.path.join(AGENT_DIR, "vendor"))
+NLTK_DATA_DIR = os.path.join(VENDOR_DIR, "nltk_data")
+MODELS_DIR = os.path.join(VENDOR_DIR, "models")
+
+if OFFLINE:
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+    if os.path.isdir(os.path.join(VENDOR_DIR, "torch")):
+        os.environ.setdefault("TORCH_HOME", os.path.join(VENDOR_DIR, "torch"))
+
+
+# NLTK resources are given as (package name, lookup path), e.g.
+# ("stopwords", "corpora/stopwords")
+def ensure_nltk_data(resources):
+    import nltk
+    if NLTK_DATA_DIR not in nltk.data.path:
+        nltk.data.path.insert(0, NLTK_DATA_DIR)
+    for name, path in resources:
+        try:
+            nltk.data.find(path)
+        except LookupError:
+            if OFFLINE:
+                raise RuntimeError(f"NLTK resource '{name}' is not available locally (AGENT_OFFLINE=1)")
+            nltk.download(name, quiet=True)
+
+
+# Prefer a vendored copy of a model (models/<name>) over a hub download
+def model_path(name):
+    local = os.path.join(MODELS_DIR, name)
+    return local if os.path.isdir(local) else name
+
+
+# Records how long each startup phase took, for health endpoints and logs
+class StartupTimer:
+    def __init__(self):
+        self.timings = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def run(self, phase, func, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            with self.lock:
+                self.errors[phase] = str(e)
+            raise
+        finally:
+            with self.lock:
+                self.timings[phase] = round(time.perf_counter() - started, 3)
+
+    def report(self):
+        with self.lock:
+            return {"offline": OFFLINE, "timings": dict(self.timings), "errors": dict(self.errors)}
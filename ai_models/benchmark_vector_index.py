@@ -0,0 +1,54 @@
+import argparse
+import time
+import numpy as np
+from vector_index import FlatIndex, INDEX_BACKENDS
+
+# Recall/latency benchmark of an index backend against brute-force search.
+# Synthetic clustered vectors stand in for report embeddings.
+#   python benchmark_vector_index.py --backend hnsw --size 50000 --k 10
+
+def make_vectors(n, dim, clusters, rng):
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    assignments = rng.integers(0, clusters, size=n)
+    return centers[assignments] + 0.3 * rng.standard_normal((n, dim)).astype(np.float32)
+
+def timed_search(index, queries, k):
+    started = time.perf_counter()
+    keys, _ = index.search(queries, k)
+    return keys, time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark a vector index against brute force")
+    parser.add_argument("--backend", default="hnsw", choices=sorted(INDEX_BACKENDS))
+    parser.add_argument("--size", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    data = make_vectors(args.size, args.dim, args.clusters, rng)
+    queries = make_vectors(args.queries, args.dim, args.clusters, rng)
+    keys = [str(i) for i in range(args.size)]
+
+    exact = FlatIndex(args.dim)
+    exact.add(keys, data)
+    candidate = INDEX_BACKENDS[args.backend](args.dim)
+    started = time.perf_counter()
+    candidate.add(keys, data)
+    build_seconds = time.perf_counter() - started
+
+    truth, exact_seconds = timed_search(exact, queries, args.k)
+    found, candidate_seconds = timed_search(candidate, queries, args.k)
+    recall = np.mean([len(set(t) & set(f)) / len(t) for t, f in zip(truth, found)])
+
+    print(f"📊 {args.backend} vs brute force | n={args.size} dim={args.dim} k={args.k} queries={args.queries}")
+    print(f"   build:            {build_seconds:.2f}s")
+    print(f"   recall@{args.k}:        {recall:.4f}")
+    print(f"   brute force:      {1000 * exact_seconds / args.queries:.3f} ms/query")
+    print(f"   {args.backend}:{' ' * (17 - len(args.backend))}{1000 * candidate_seconds / args.queries:.3f} ms/query")
+
+if __name__ == "__main__":
+    main()
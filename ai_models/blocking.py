@@ -0,0 +1,93 @@
+import numpy as np
+import os
+from match_fusion import coordinates, field, report_days
+
+# Blocking: cheap structured rules deciding which (lost, found) pairs are
+# plausible at all, applied before anything is sent to the ML agents. A pair
+# is kept when it agrees on category (and subCategory when both have one),
+# was seen in the same city or in neighbouring cells of a lat/lng grid, and
+# was found within a window after it was lost. A field missing on either
+# side never rules a pair out.
+#
+# The coordinator blocks its own batches and, for index-backed matching,
+# sends blocking_settings() to the agents instead of candidate lists. The
+# agents keep blocking_keys() of every indexed lost report and filter their
+# index hits with index_filter().
+
+BLOCKING_ENABLED = os.environ.get("BLOCKING", "1") == "1"
+BLOCK_CELL_KM = float(os.environ.get("BLOCK_CELL_KM", "25"))
+BLOCK_DATE_WINDOW_DAYS = float(os.environ.get("BLOCK_DATE_WINDOW_DAYS", "60"))
+KM_PER_DEGREE = 111.0
+
+
+def same_or_unknown(lost_values, found_values):
+    return ((lost_values[:, None] == found_values[None, :])
+            | (lost_values == "")[:, None] | (found_values == "")[None, :])
+
+
+def category_block(lost_reports, found_reports):
+    block = np.ones((len(lost_reports), len(found_reports)), dtype=bool)
+    for name in ("category", "subCategory"):
+        block &= same_or_unknown(field(lost_reports, "itemDetails", name), field(found_reports, "itemDetails", name))
+    return block
+
+
+# Grid cell of each report's last seen location; cells are BLOCK_CELL_KM wide
+# in latitude and narrow towards the poles in longitude
+def grid_cells(reports, cell_km=BLOCK_CELL_KM):
+    points = np.degrees(coordinates(reports))
+    cell_degrees = cell_km / KM_PER_DEGREE
+    rows = np.floor(points[:, 0] / cell_degrees)
+    cols = np.floor(points[:, 1] * np.cos(np.radians(points[:, 0])) / cell_degrees)
+    return rows, cols
+
+
+def location_block(lost_reports, found_reports, cell_km=BLOCK_CELL_KM):
+    lost_rows, lost_cols = grid_cells(lost_reports, cell_km)
+    found_rows, found_cols = grid_cells(found_reports, cell_km)
+    with np.errstate(invalid="ignore"):
+        nearby = ((np.abs(lost_rows[:, None] - found_rows[None, :]) <= 1)
+                  & (np.abs(lost_cols[:, None] - found_cols[None, :]) <= 1))
+    unknown = np.isnan(lost_rows)[:, None] | np.isnan(found_rows)[None, :]
+    lost_city = field([(r.get("locationDetails") or {}) for r in lost_reports], "lastSeenLocation", "city")
+    found_city = field([(r.get("locationDetails") or {}) for r in found_reports], "lastSeenLocation", "city")
+    same_city = (lost_city[:, None] == found_city[None, :]) & (lost_city != "")[:, None]
+    return nearby | unknown | same_city
+
+
+def date_block(lost_reports, found_reports, window_days=BLOCK_DATE_WINDOW_DAYS):
+    gap = report_days(found_reports)[None, :] - report_days(lost_reports)[:, None]
+    with np.errstate(invalid="ignore"):
+        return np.isnan(gap) | ((gap >= -1) & (gap <= window_days))
+
+
+def candidate_mask(lost_reports, found_reports, cell_km=BLOCK_CELL_KM, window_days=BLOCK_DATE_WINDOW_DAYS):
+    return (category_block(lost_reports, found_reports)
+            & location_block(lost_reports, found_reports, cell_km)
+            & date_block(lost_reports, found_reports, window_days))
+
+
+def blocking_settings():
+    return {"cell_km": BLOCK_CELL_KM, "window_days": BLOCK_DATE_WINDOW_DAYS}
+
+
+# The fields of a (serialized) report the blocking rules read, in report shape
+def blocking_keys(report):
+    details = report.get("itemDetails") or {}
+    location = report.get("locationDetails") or {}
+    seen = location.get("lastSeenLocation") or {}
+    return {
+        "itemDetails": {name: details.get(name) for name in ("category", "subCategory")},
+        "locationDetails": {
+            "lastSeenLocation": {name: seen.get(name) for name in ("city", "lat", "lng")},
+            "lostDate": location.get("lostDate")
+        }
+    }
+
+
+# Filter for one found report's index search: maps indexed lost report ids
+# to a mask of the plausible ones, from the blocking keys stored in the index
+def index_filter(report_index, found_report, settings):
+    def plausible(report_ids):
+        return candidate_mask(report_index.attributes(report_ids), [found_report], **settings)[:, 0]
+    return plausible
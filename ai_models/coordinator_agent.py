@@ -1,8 +1,19 @@
 from flask import Flask, jsonify
 from bson import ObjectId
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import ConnectionFailure, OperationFailure, PyMongoError
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from collections import Counter
+from image_paths import ImagePathResolver
+from match_fusion import FUSED_THRESHOLD, fuse, ml_confident, structured_signals
+from blocking import BLOCKING_ENABLED, blocking_keys, blocking_settings, candidate_mask
+import score_matrix
+import numpy as np
 import requests
+import threading
+import hashlib
 import time
 import os
 
@@ -12,9 +23,54 @@ app = Flask(__name__)
 client = MongoClient("mongodb://100.65.0.126:27017/")
 db = client["Lost_Found_new"]
 reports_collection = db["reports"]
+state_collection = db["coordinator_state"]
+ledger_collection = db["pair_evaluations"]
 
 # Base paths
 BASE_IMAGE_PATH = r"\\DESKTOP-GF89051\uploads"
+image_resolver = ImagePathResolver(os.environ.get("BASE_IMAGE_PATH", BASE_IMAGE_PATH))
+IMAGE_TRANSPORT = os.environ.get("IMAGE_TRANSPORT", "ids")
+IMAGE_UPLOAD_BATCH = int(os.environ.get("IMAGE_UPLOAD_BATCH", "32"))
+
+# Query the agents' lost-report indexes (top-k) instead of sending the full lost list
+USE_TEXT_INDEX = os.environ.get("USE_TEXT_INDEX", "1") == "1"
+TEXT_INDEX_TOP_K = int(os.environ.get("TEXT_INDEX_TOP_K", "20"))
+USE_IMAGE_INDEX = os.environ.get("USE_IMAGE_INDEX", "1") == "1"
+IMAGE_INDEX_TOP_K = int(os.environ.get("IMAGE_INDEX_TOP_K", "20"))
+
+# Found reports sent per agent request; the lost list is serialized once per cycle
+FOUND_BATCH_SIZE = int(os.environ.get("FOUND_BATCH_SIZE", "200"))
+
+# Agent endpoints and dispatch limits (timeouts are in seconds)
+TEXT_AGENT_URL = os.environ.get("TEXT_AGENT_URL", "http://localhost:5001")
+IMAGE_AGENT_URL = os.environ.get("IMAGE_AGENT_URL", "http://localhost:5002")
+TEXT_AGENT_TIMEOUT = float(os.environ.get("TEXT_AGENT_TIMEOUT", "120"))
+IMAGE_AGENT_TIMEOUT = float(os.environ.get("IMAGE_AGENT_TIMEOUT", "300"))
+MAX_IN_FLIGHT_REQUESTS = int(os.environ.get("MAX_IN_FLIGHT_REQUESTS", "4"))
+PARALLEL_FOUND_BATCHES = int(os.environ.get("PARALLEL_FOUND_BATCHES", "2"))
+
+# "incremental" reacts to report changes (change streams, or polling on
+# updatedAt without a replica set); "poll" rescans all reports every cycle
+COORDINATOR_MODE = os.environ.get("COORDINATOR_MODE", "incremental")
+POLL_INTERVAL = int(os.environ.get("POLL_INTERVAL", "30"))
+CHANGE_POLL_INTERVAL = float(os.environ.get("CHANGE_POLL_INTERVAL", "5"))
+CHANGE_BATCH_WINDOW = float(os.environ.get("CHANGE_BATCH_WINDOW", "2"))
+MAX_CHANGE_BATCH = int(os.environ.get("MAX_CHANGE_BATCH", "500"))
+POOL_REFRESH_SECONDS = int(os.environ.get("POOL_REFRESH_SECONDS", "3600"))
+MATCH_FIELDS = {"reportType", "status", "itemDetails", "locationDetails", "matchedReportIds", "isMatched"}
+FETCH_BATCH_SIZE = int(os.environ.get("FETCH_BATCH_SIZE", "1000"))
+
+# Skip (lost, found) pairs an agent already scored with the same inputs and model version
+LEDGER_ENABLED = os.environ.get("PAIR_LEDGER", "1") == "1"
+LEDGER_WRITE_BATCH = int(os.environ.get("PAIR_LEDGER_WRITE_BATCH", "1000"))
+
+# Match results are written with unordered bulk writes, MATCH_WRITE_BATCH
+# matches (two updates each) per request. A transaction keeps the lost and
+# found sides consistent but needs a replica set.
+MATCH_WRITE_BATCH = int(os.environ.get("MATCH_WRITE_BATCH", "500"))
+MATCH_WRITE_RETRIES = int(os.environ.get("MATCH_WRITE_RETRIES", "3"))
+MATCH_WRITE_BACKOFF = float(os.environ.get("MATCH_WRITE_BACKOFF", "0.5"))
+MATCH_WRITE_TRANSACTION = os.environ.get("MATCH_WRITE_TRANSACTION", "0") == "1"
 
 # Logging helper
 def log(message, status="INFO"):
@@ -28,6 +84,18 @@ def log(message, status="INFO"):
     }
     print(f"{symbols.get(status, 'ℹ️')} [Coordinator Agent] {message}")
 
+# One pooled HTTP session shared by all dispatch threads; the semaphore caps
+# how many agent requests are outstanding at once
+session = requests.Session()
+session.mount("http://", HTTPAdapter(pool_connections=2, pool_maxsize=MAX_IN_FLIGHT_REQUESTS))
+in_flight = threading.BoundedSemaphore(MAX_IN_FLIGHT_REQUESTS)
+agent_pool = ThreadPoolExecutor(max_workers=2 * PARALLEL_FOUND_BATCHES, thread_name_prefix="agent-dispatch")
+batch_pool = ThreadPoolExecutor(max_workers=PARALLEL_FOUND_BATCHES, thread_name_prefix="found-batch")
+
+def post(url, payload, timeout):
+    with in_flight:
+        return session.post(url, json=payload, timeout=timeout)
+
 def serialize(report):
     def convert(value):
         if isinstance(value, ObjectId):
@@ -41,10 +109,11 @@ def serialize(report):
         return value
     return {k: convert(v) for k, v in report.items()}
 
-def check_service(url, name):
+def check_service(url, name, agent):
     try:
-        res = requests.post(url, json={"lost": [], "found": []}, timeout=5)
+        res = session.post(url, json={"lost": [], "found": []}, timeout=5)
         if res.status_code == 200:
+            agent_versions[agent] = res.json().get("model_version")
             log(f"{name} is online and responding ✅", "DONE")
             return True
         else:
@@ -54,189 +123,735 @@ def check_service(url, name):
         log(f"{name} unreachable: {e}", "ERROR")
         return False
 
+# Fields the agents and the coordinator use; fraud flags and match history stay in Mongo
+REPORT_PROJECTION = {
+    "reportType": 1, "status": 1, "isMatched": 1, "matchedReportIds": 1,
+    "itemDetails": 1, "locationDetails": 1, "createdAt": 1, "updatedAt": 1
+}
+
+def unmatched_query(report_type):
+    return {"reportType": report_type, "status": "active", "isMatched": {"$ne": True}}
+
+# isMatched mirrors a non-empty matchedReportIds so the unmatched query can be
+# answered from the (reportType, status, isMatched) index; reports created
+# without the flag still match {"$ne": True}
+def ensure_report_indexes():
+    reports_collection.create_index([("reportType", 1), ("status", 1), ("isMatched", 1)], name="unmatched_reports")
+    reports_collection.create_index([("updatedAt", 1)], name="updated_at")
+
+    backfilled = reports_collection.update_many(
+        {"isMatched": {"$exists": False}, "matchedReportIds.0": {"$exists": True}},
+        {"$set": {"isMatched": True}}
+    ).modified_count
+    if backfilled:
+        log(f"Flagged {backfilled} previously matched report(s) with isMatched", "PROCESS")
+
+    plan = reports_collection.find(unmatched_query("lost"), REPORT_PROJECTION).explain()
+    if "unmatched_reports" in str(plan.get("queryPlanner", {}).get("winningPlan")):
+        log("Unmatched report query is index-backed", "DONE")
+    else:
+        log("Unmatched report query is not using the unmatched_reports index", "ERROR")
+
+def iter_unmatched_reports(report_type):
+    cursor = reports_collection.find(unmatched_query(report_type), REPORT_PROJECTION).batch_size(FETCH_BATCH_SIZE)
+    with cursor:
+        yield from cursor
+
 def fetch_unmatched_reports():
     log("Fetching unmatched lost and found reports...", "CHECK")
-    lost = list(reports_collection.find({
-        "reportType": "lost",
-        "status": "active",
-        "$or": [{"matchedReportIds": {"$exists": False}}, {"matchedReportIds": {"$size": 0}}]
-    }))
-    found = list(reports_collection.find({
-        "reportType": "found",
-        "status": "active",
-        "$or": [{"matchedReportIds": {"$exists": False}}, {"matchedReportIds": {"$size": 0}}]
-    }))
+    lost = list(iter_unmatched_reports("lost"))
+    found = list(iter_unmatched_reports("found"))
     log(f"Fetched {len(lost)} lost and {len(found)} found", "PROCESS")
     return lost, found
 
 def attach_image_paths(reports, report_type):
-    folder = os.path.join(BASE_IMAGE_PATH, report_type.capitalize())
-    try:
-        files = os.listdir(folder)
-        existing = {os.path.splitext(f)[0].lower(): f for f in files}
-    except Exception as e:
-        log(f"❌ Cannot access folder {folder}: {e}", "ERROR")
-        existing = {}
-
     for report in reports:
-        filenames = report.get("itemDetails", {}).get("images", [])
-        paths = []
-        for filename in filenames:
-            base = os.path.splitext(os.path.basename(filename))[0].lower()
-            match = existing.get(base)
-            if match:
-                path = os.path.normpath(os.path.join(folder, match))
-                if os.path.isfile(path):
-                    paths.append(path)
-                else:
-                    log(f"File listed but not on disk: {path}", "ERROR")
-            else:
-                log(f"File not found for base name: {base}", "ERROR")
+        paths, signatures = [], []
+        for filename in report.get("itemDetails", {}).get("images", []):
+            path = image_resolver.resolve(filename, report_type)
+            if not path:
+                log(f"Image not found on share: {filename}", "ERROR")
+                continue
+            paths.append(path)
+            signatures.append(image_resolver.signature(path) or "")
         report["image_paths"] = paths
+        report["image_hashes"] = signatures
+
+# ------------------------
+# Image Ingest
+# ------------------------
+
+# With IMAGE_TRANSPORT=ids each image is read from the share once, uploaded to
+# the image agent under its stored name, and matching requests carry only
+# those ids; "paths" sends share paths the agent has to open itself. Every
+# batch asks the agent which images it is missing, passing each file's
+# signature from the resolver's cached directory scan, so images the agent
+# lost or files replaced on the share are uploaded again.
+def upload_images(image_ids, signatures, files):
+    with in_flight:
+        res = session.post(f"{IMAGE_AGENT_URL}/images/ingest", data={"ids": image_ids, "signatures": signatures},
+                           files=files, timeout=IMAGE_AGENT_TIMEOUT)
+    res.raise_for_status()
+    return res.json()
+
+# Returns {image_id: content hash} for the images the agent holds; agent
+# errors propagate so the batch is retried rather than matched without images
+def ingest_images(image_ids, report_type):
+    paths, signatures = {}, {}
+    for image_id in dict.fromkeys(image_ids):
+        path = image_resolver.resolve(image_id, report_type)
+        if not path:
+            log(f"Image not found on share: {image_id}", "ERROR")
+            continue
+        paths[image_id] = path
+        signatures[image_id] = image_resolver.signature(path) or ""
+    if not paths:
+        return {}
+
+    res = post(f"{IMAGE_AGENT_URL}/images/missing", {"ids": list(paths), "signatures": signatures}, IMAGE_AGENT_TIMEOUT)
+    res.raise_for_status()
+    body = res.json()
+    hashes = body.get("hashes", {})
+    missing = body.get("missing", [])
+
+    uploaded = 0
+    for batch in chunked(missing, IMAGE_UPLOAD_BATCH):
+        files = []
+        for image_id in batch:
+            with open(paths[image_id], "rb") as f:
+                files.append(("images", (os.path.basename(paths[image_id]), f.read())))
+        stored = upload_images(batch, [signatures[i] for i in batch], files).get("hashes", {})
+        hashes.update(stored)
+        uploaded += len(stored)
+    if missing:
+        log(f"Uploaded {uploaded} of {len(missing)} new or changed image(s) to Image Matching Agent", "SEND")
+    return hashes
+
+def attach_image_ids(reports, report_type):
+    hashes = ingest_images([i for r in reports for i in r.get("itemDetails", {}).get("images", [])], report_type)
+    for report in reports:
+        report["image_ids"] = [i for i in report.get("itemDetails", {}).get("images", []) if i in hashes]
+        report["image_hashes"] = [hashes[i] for i in report["image_ids"]]
+
+def attach_images(reports, report_type):
+    if IMAGE_TRANSPORT == "ids":
+        attach_image_ids(reports, report_type)
+    else:
+        attach_image_paths(reports, report_type)
 
-def send_to_text_matching_agent(lost_reports, found_report):
-    log(f"Sending Found[{found_report['_id']}] to Text Matching Agent...", "SEND")
+def chunked(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def send_to_text_matching_agent(lost_payload, found_payload, use_index=False, blocking=None):
+    log(f"Sending {len(found_payload)} found report(s) to Text Matching Agent...", "SEND")
     try:
-        res = requests.post("http://localhost:5001/match-text", json={
-            "lost": [serialize(l) for l in lost_reports],
-            "found": [serialize(found_report)]
-        })
+        if use_index:
+            payload = {"found": found_payload, "top_k": TEXT_INDEX_TOP_K, "blocking": blocking}
+        else:
+            payload = {"lost": lost_payload, "found": found_payload}
+        payload["include_scores"] = True
+        res = post(f"{TEXT_AGENT_URL}/match-text", payload, TEXT_AGENT_TIMEOUT)
         if res.status_code == 200:
-            matches = res.json().get("matches", [])
-            log(f"Text Matches: {matches}", "PROCESS")
-            return matches
+            body = res.json()
+            agent_versions["text"] = body.get("model_version")
+            log(f"Text Agent returned {len(body.get('matches', []))} match(es) above its own threshold", "PROCESS")
+            return score_matrix.decode(body["scores"])
         else:
             log(f"Text Agent error: {res.status_code}", "ERROR")
     except Exception as e:
         log(f"Text Agent unreachable: {e}", "ERROR")
-    return []
+    return None
 
-def send_to_image_matching_agent(lost_reports, found_report):
-    log(f"Sending Found[{found_report['_id']}] to Image Matching Agent...", "SEND")
+def text_hash(report):
+    details = report.get("itemDetails", {})
+    text = details.get("title", "") + " " + details.get("description", "")
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+# Reports whose image list changes are re-indexed by the image agent
+def image_names_hash(report):
+    names = sorted(report.get("itemDetails", {}).get("images", []))
+    return hashlib.sha1("\n".join(names).encode("utf-8")).hexdigest()
+
+# Hash of the fields the blocking rules read, part of every index tag so the
+# blocking keys the agents store are refreshed when they change
+def blocking_hash(report):
+    return hashlib.sha1(repr(serialize(blocking_keys(report))).encode("utf-8")).hexdigest()
+
+# Bring an agent's lost-report index in line with the active lost reports:
+# the agent drops stale entries and we send only the reports it is missing
+def sync_agent_index(base_url, name, lost_reports, timeout, hashes=None, prepare=None):
+    log(f"Syncing {name} index with active lost reports...", "SEND")
+    hashes = hashes or {}
+    tags = {str(l["_id"]): f"{hashes.get(str(l['_id']), '')}:{blocking_hash(l)}" for l in lost_reports}
     try:
-        attach_image_paths([found_report], "found")
-        attach_image_paths(lost_reports, "lost")
+        res = post(f"{base_url}/index/sync", {
+            "ids": [str(l["_id"]) for l in lost_reports],
+            "hashes": tags
+        }, timeout)
+        res.raise_for_status()
+        missing = set(res.json().get("missing", []))
+        new_reports = [l for l in lost_reports if str(l["_id"]) in missing]
+        if new_reports:
+            if prepare:
+                prepare(new_reports)
+            res = post(f"{base_url}/index/add", {
+                "reports": [serialize(l) for l in new_reports],
+                "hashes": {str(l["_id"]): tags[str(l["_id"])] for l in new_reports}
+            }, timeout)
+            res.raise_for_status()
+            log(f"Indexed {len(new_reports)} lost report(s) in {name}", "PROCESS")
+        return True
+    except Exception as e:
+        log(f"{name} index sync failed: {e}", "ERROR")
+        return False
+
+def sync_text_index(lost_reports):
+    hashes = {str(l["_id"]): text_hash(l) for l in lost_reports}
+    return sync_agent_index(TEXT_AGENT_URL, "Text Matching Agent", lost_reports, TEXT_AGENT_TIMEOUT, hashes=hashes)
+
+def sync_image_index(lost_reports):
+    hashes = {str(l["_id"]): image_names_hash(l) for l in lost_reports}
+    return sync_agent_index(IMAGE_AGENT_URL, "Image Matching Agent", lost_reports, IMAGE_AGENT_TIMEOUT,
+                            hashes=hashes, prepare=lambda reports: attach_images(reports, "lost"))
 
-        res = requests.post("http://localhost:5002/match-image", json={
-            "lost": [serialize(l) for l in lost_reports],
-            "found": [serialize(found_report)]
-        })
+def send_to_image_matching_agent(lost_payload, found_payload, use_index=False, blocking=None):
+    log(f"Sending {len(found_payload)} found report(s) to Image Matching Agent...", "SEND")
+    try:
+        if use_index:
+            payload = {"found": found_payload, "top_k": IMAGE_INDEX_TOP_K, "blocking": blocking}
+        else:
+            payload = {"lost": lost_payload, "found": found_payload}
+        payload["include_scores"] = True
+        res = post(f"{IMAGE_AGENT_URL}/match-image", payload, IMAGE_AGENT_TIMEOUT)
         if res.status_code == 200:
-            matches = res.json().get("matches", [])
-            log(f"Image Matches: {matches}", "PROCESS")
-            return matches
+            body = res.json()
+            agent_versions["image"] = body.get("model_version")
+            log(f"Image Agent returned {len(body.get('matches', []))} match(es) above its own threshold", "PROCESS")
+            return score_matrix.decode(body["scores"])
         else:
             log(f"Image Agent error: {res.status_code}", "ERROR")
     except Exception as e:
         log(f"Image Agent unreachable: {e}", "ERROR")
-    return []
-
-def merge_and_average_matches(text_matches, image_matches):
-    log("Merging and averaging match scores...", "PROCESS")
-    merged = {}
-    for match in text_matches + image_matches:
-        key = (match["lost_id"], match["found_id"])
-        if key not in merged:
-            merged[key] = {
-                "lost_id": match["lost_id"],
-                "found_id": match["found_id"],
-                "scores": [match["score"]],
-                "matched_on": match.get("matched_on", datetime.now().isoformat())
-            }
-        else:
-            merged[key]["scores"].append(match["score"])
-    return [{
-        "lost_id": val["lost_id"],
-        "found_id": val["found_id"],
-        "score": sum(val["scores"]) / len(val["scores"]),
-        "matched_on": val["matched_on"]
-    } for val in merged.values()]
+    return None
 
-def update_report_matches(matches):
-    log(f"Updating {len(matches)} match(es) in database...", "PROCESS")
-    for match in matches:
-        lost_id = match["lost_id"]
-        found_id = match["found_id"]
-        score = match["score"]
-        matched_on = match["matched_on"]
+# ------------------------
+# Pair Evaluation Ledger
+# ------------------------
+
+# Every pair an agent scores is recorded in pair_evaluations with its score,
+# the agent's model version and a hash of both reports' inputs. Pairs whose
+# inputs and model are unchanged are not sent again, and below-threshold
+# scores stay available as an audit trail of near misses.
+agent_versions = {}
+
+# Image names plus their content: the agent's content hashes with
+# IMAGE_TRANSPORT=ids, the files' mtime/size signatures with paths
+def image_hash(report):
+    details = report.get("itemDetails", {})
+    names = (sorted(details.get("images", [])) + sorted(report.get("image_paths", []))
+             + sorted(report.get("image_ids", [])) + sorted(report.get("image_hashes", [])))
+    return hashlib.sha1("|".join(names).encode("utf-8")).hexdigest()
+
+CONTENT_HASHES = {"text": text_hash, "image": image_hash}
+
+def pair_hash(lost_hash, found_hash):
+    return hashlib.sha1(f"{lost_hash}:{found_hash}".encode("utf-8")).hexdigest()
+
+def ensure_ledger_indexes():
+    ledger_collection.create_index([("found_id", 1), ("agent", 1), ("model_version", 1)])
+    ledger_collection.create_index([("lost_id", 1), ("agent", 1)])
+
+# Drop found reports (and lost reports) whose pairs this agent has all scored
+# before; the recorded scores come back as a table so fusion can still use them
+def pending_payloads(agent, lost_payload, found_payload):
+    version = agent_versions.get(agent)
+    if version is None or not lost_payload:
+        return lost_payload, found_payload, None
+    content_hash = CONTENT_HASHES[agent]
+    lost_hashes = {l["_id"]: content_hash(l) for l in lost_payload}
+    found_hashes = {f["_id"]: content_hash(f) for f in found_payload}
+
+    done = []
+    for entry in ledger_collection.find(
+        {"agent": agent, "model_version": version, "found_id": {"$in": list(found_hashes)}},
+        {"_id": 0, "lost_id": 1, "found_id": 1, "content_hash": 1, "score": 1}
+    ):
+        lost_hash = lost_hashes.get(entry["lost_id"])
+        if lost_hash and entry["content_hash"] == pair_hash(lost_hash, found_hashes[entry["found_id"]]):
+            done.append((entry["lost_id"], entry["found_id"], entry.get("score")))
 
+    done_per_found = Counter(found_id for _, found_id, _ in done)
+    pending_found = [f for f in found_payload if done_per_found[f["_id"]] < len(lost_hashes)]
+    pending_found_ids = {f["_id"] for f in pending_found}
+    done_per_lost = Counter(lost_id for lost_id, found_id, _ in done if found_id in pending_found_ids)
+    pending_lost = [l for l in lost_payload if done_per_lost[l["_id"]] < len(pending_found)]
+    if len(done):
+        log(f"Ledger: skipping {len(done)} already-scored {agent} pair(s); "
+            f"{len(pending_lost)} lost × {len(pending_found)} found left", "PROCESS")
+    return pending_lost, pending_found, score_matrix.from_pairs(done)
+
+def record_evaluations(agent, lost_payload, found_payload, table, use_index):
+    version = agent_versions.get(agent)
+    content_hash = CONTENT_HASHES[agent]
+    lost_hashes = {l["_id"]: content_hash(l) for l in lost_payload}
+    found_hashes = {f["_id"]: content_hash(f) for f in found_payload}
+    if use_index:
+        # Only the index candidates were scored; lost reports are not in the payload
+        pairs = score_matrix.scored_pairs(table)
+    else:
+        # Pairs the agent could not score (e.g. no images) are recorded with no score
+        lost_ids, found_ids = list(lost_hashes), list(found_hashes)
+        matrix = score_matrix.align(table, lost_ids, found_ids)
+        pairs = [(lost_ids[r], found_ids[c], matrix[r, c]) for r, c in np.ndindex(matrix.shape)]
+
+    now = datetime.utcnow()
+    operations = []
+    for lost_id, found_id, score in pairs:
+        entry = {
+            "lost_id": lost_id,
+            "found_id": found_id,
+            "agent": agent,
+            "score": None if np.isnan(score) else round(float(score), 4),
+            "model_version": version,
+            "evaluated_at": now
+        }
+        if lost_id in lost_hashes:
+            entry["content_hash"] = pair_hash(lost_hashes[lost_id], found_hashes[found_id])
+        operations.append(UpdateOne({"_id": f"{lost_id}:{found_id}:{agent}"}, {"$set": entry}, upsert=True))
+    for batch in chunked(operations, LEDGER_WRITE_BATCH):
+        ledger_collection.bulk_write(batch, ordered=False)
+
+SENDERS = {"text": send_to_text_matching_agent, "image": send_to_image_matching_agent}
+
+# Raw score table of one agent for a found batch (fresh scores plus, with the
+# ledger, the recorded scores of pairs that were skipped). A failed agent call
+# raises, so the batch is retried instead of being fused without that agent.
+def dispatch(agent, lost_payload, found_payload, use_index, blocking=None):
+    known = None
+    if LEDGER_ENABLED and not use_index:
+        lost_payload, found_payload, known = pending_payloads(agent, lost_payload, found_payload)
+        if not found_payload or not lost_payload:
+            return known if known is not None else score_matrix.from_pairs([])
+    table = SENDERS[agent](lost_payload, found_payload, use_index, blocking)
+    if table is None:
+        raise RuntimeError(f"{agent} agent returned no scores for {len(found_payload)} found report(s)")
+    if LEDGER_ENABLED:
         try:
-            log(f"Updating: Lost[{lost_id}] ↔ Found[{found_id}] (Score: {score:.2f})", "PROCESS")
-
-            found_result = reports_collection.update_one(
-                {"_id": ObjectId(found_id)},
-                {
-                    "$set": {"status": "matched"},
-                    "$addToSet": {
-                        "matchedReportIds": lost_id,
-                        "matchDetails": {
-                            "report_id": lost_id,
-                            "score": score,
-                            "matched_on": matched_on
-                        }
-                    }
-                }
-            )
-
-            lost_result = reports_collection.update_one(
-                {"_id": ObjectId(lost_id)},
-                {
-                    "$set": {"status": "matched"},
-                    "$addToSet": {
-                        "matchedReportIds": found_id,
-                        "matchDetails": {
-                            "report_id": found_id,
-                            "score": score,
-                            "matched_on": matched_on
-                        }
+            record_evaluations(agent, lost_payload, found_payload, table, use_index)
+        except Exception as e:
+            log(f"Failed to record {agent} pair evaluations: {e}", "ERROR")
+    return score_matrix.combine(known, table) if known is not None else table
+
+# ------------------------
+# Score Fusion
+# ------------------------
+
+# One fused score per candidate pair from the agents' raw scores and the
+# structured report fields, with a single threshold. A pair is a candidate
+# when at least one agent scored it, and can match only when one agent's
+# score clears that agent's floor.
+def fuse_matches(lost_by_id, found_batch, tables, block=None):
+    tables = {agent: table for agent, table in tables.items() if table is not None}
+    found_ids = [str(f["_id"]) for f in found_batch]
+    lost_ids = [i for i in dict.fromkeys(i for table in tables.values() for i in table[0]) if i in lost_by_id]
+    if not lost_ids:
+        return []
+
+    signals = {agent: score_matrix.align(table, lost_ids, found_ids) for agent, table in tables.items()}
+    candidates = np.any([~np.isnan(scores) for scores in signals.values()], axis=0)
+    confident = ml_confident(signals)
+    if block is not None:
+        # Ledger scores and unrestricted searches can cover pairs the blocking stage rules out
+        candidates &= score_matrix.align(block, lost_ids, found_ids) == 1
+    signals.update(structured_signals([lost_by_id[i] for i in lost_ids], found_batch))
+    fused = fuse(signals)
+
+    rows, cols = np.nonzero(candidates & confident & (fused >= FUSED_THRESHOLD))
+    matched_on = datetime.now().isoformat()
+    log(f"Fused {int(candidates.sum())} candidate pair(s): {len(rows)} above {FUSED_THRESHOLD}", "PROCESS")
+    return [{
+        "lost_id": lost_ids[row],
+        "found_id": found_ids[col],
+        "score": round(float(fused[row, col]), 4),
+        "matched_on": matched_on
+    } for row, col in zip(rows, cols)]
+
+# ------------------------
+# Blocking
+# ------------------------
+
+# Plausible (lost, found) pairs of a found batch as a score table (1 = keep),
+# plus the lost and found payloads trimmed to reports with any candidate
+def block_candidates(lost_by_id, lost_payload, found_batch, found_payload):
+    lost_ids = list(lost_by_id)
+    found_ids = [str(f["_id"]) for f in found_batch]
+    mask = candidate_mask(list(lost_by_id.values()), found_batch)
+    total, kept = mask.size, int(mask.sum())
+    log(f"Blocking: {kept} of {total} candidate pair(s) kept "
+        f"({100 * (1 - kept / max(total, 1)):.1f}% pruned)", "PROCESS")
+
+    keep_lost = {lost_ids[i] for i in np.nonzero(mask.any(axis=1))[0]}
+    keep_found = {found_ids[i] for i in np.nonzero(mask.any(axis=0))[0]}
+    block = (lost_ids, found_ids, np.where(mask, 1.0, np.nan))
+    return (block,
+            [l for l in lost_payload if l["_id"] in keep_lost],
+            [f for f in found_payload if f["_id"] in keep_found])
+
+# Both sides of a match are updated together; each match becomes two UpdateOne ops
+def match_operations(match, now):
+    operations = []
+    for report_id, other_id in ((match["found_id"], match["lost_id"]), (match["lost_id"], match["found_id"])):
+        operations.append(UpdateOne(
+            {"_id": ObjectId(report_id)},
+            {
+                "$set": {"status": "matched", "isMatched": True, "updatedAt": now},
+                "$addToSet": {
+                    "matchedReportIds": other_id,
+                    "matchDetails": {
+                        "report_id": other_id,
+                        "score": match["score"],
+                        "matched_on": match["matched_on"]
                     }
                 }
-            )
+            }
+        ))
+    return operations
+
+# Network errors and errors Mongo labels as transient are worth retrying; the
+# updates are idempotent ($set / $addToSet with a fixed timestamp)
+def is_transient(error):
+    return isinstance(error, ConnectionFailure) or error.has_error_label("TransientTransactionError")
+
+def write_match_batch(operations):
+    for attempt in range(1, MATCH_WRITE_RETRIES + 1):
+        started = time.perf_counter()
+        try:
+            if MATCH_WRITE_TRANSACTION:
+                with client.start_session() as mongo_session:
+                    result = mongo_session.with_transaction(
+                        lambda s: reports_collection.bulk_write(operations, ordered=False, session=s))
+            else:
+                result = reports_collection.bulk_write(operations, ordered=False)
+            elapsed = (time.perf_counter() - started) * 1000
+            log(f"Wrote {len(operations)} update(s) in {elapsed:.1f} ms "
+                f"({result.modified_count} modified, attempt {attempt})", "DONE")
+            return result
+        except PyMongoError as e:
+            if attempt == MATCH_WRITE_RETRIES or not is_transient(e):
+                raise
+            delay = MATCH_WRITE_BACKOFF * 2 ** (attempt - 1)
+            log(f"Transient write error ({e}); retrying in {delay:.1f}s", "ERROR")
+            time.sleep(delay)
 
+def update_report_matches(matches):
+    log(f"Updating {len(matches)} match(es) in database...", "PROCESS")
+    now = datetime.utcnow()
+    for batch in chunked(matches, MATCH_WRITE_BATCH):
+        operations = []
+        for match in batch:
+            log(f"Updating: Lost[{match['lost_id']}] ↔ Found[{match['found_id']}] (Score: {match['score']:.2f})", "PROCESS")
+            operations.extend(match_operations(match, now))
+        try:
+            write_match_batch(operations)
         except Exception as e:
-            log(f"❌ Failed to update reports: {e}", "ERROR")
+            # Fail the found batch so its changes are replayed; the writes are idempotent
+            log(f"❌ Failed to update {len(batch)} match(es): {e}", "ERROR")
+            raise
 
     log("✅ Database update complete.", "DONE")
 
-def coordinator_loop():
-    log("Coordinator Agent starting...", "CHECK")
+# Text and image matching for one found batch run side by side, so the batch
+# takes as long as the slower agent rather than the sum of both
+def process_found_batch(lost_by_id, lost_payload, found_batch, text_index_ready, image_index_ready):
+    found_payload = [serialize(f) for f in found_batch]
+    block = blocking = None
+    if BLOCKING_ENABLED:
+        block, lost_payload, found_payload = block_candidates(lost_by_id, lost_payload, found_batch, found_payload)
+        if not found_payload:
+            log(f"No plausible candidates for {len(found_batch)} found report(s)", "PROCESS")
+            return
+        # Index searches apply the same rules agent-side to the blocking keys
+        # stored with the indexed lost reports
+        blocking = blocking_settings()
+    text_future = agent_pool.submit(dispatch, "text", lost_payload, found_payload, text_index_ready, blocking)
+    image_future = agent_pool.submit(dispatch, "image", lost_payload, found_payload, image_index_ready, blocking)
+
+    tables = {"text": text_future.result(), "image": image_future.result()}
+    matches = fuse_matches(lost_by_id, found_batch, tables, block)
+
+    if matches:
+        update_report_matches(matches)
+    else:
+        log(f"No match found for {len(found_batch)} found report(s)", "PROCESS")
+
+# Match a set of found reports against the lost pool (index-backed when available)
+def match_found_reports(lost_reports, found_reports):
+    text_sync = agent_pool.submit(lambda: USE_TEXT_INDEX and sync_text_index(lost_reports))
+    image_sync = agent_pool.submit(lambda: USE_IMAGE_INDEX and sync_image_index(lost_reports))
+    text_index_ready, image_index_ready = text_sync.result(), image_sync.result()
+
+    # Image paths are resolved and every report serialized once per call;
+    # found reports then go out in batches, one request per agent per batch
+    attach_images(found_reports, "found")
+    lost_payload = []
+    if not (text_index_ready and image_index_ready):
+        if not image_index_ready:
+            attach_images(lost_reports, "lost")
+        lost_payload = [serialize(l) for l in lost_reports]
+
+    run_found_batches(lost_reports, lost_payload, found_reports, text_index_ready, image_index_ready)
+
+# Match newly added or edited lost reports against every unmatched found report
+def match_lost_reports(lost_reports, found_reports):
+    attach_images(lost_reports, "lost")
+    attach_images(found_reports, "found")
+    run_found_batches(lost_reports, [serialize(l) for l in lost_reports], found_reports, False, False)
+
+def run_found_batches(lost_reports, lost_payload, found_reports, text_index_ready, image_index_ready):
+    lost_by_id = {str(l["_id"]): l for l in lost_reports}
+    futures = [
+        batch_pool.submit(process_found_batch, lost_by_id, lost_payload, found_batch,
+                          text_index_ready, image_index_ready)
+        for found_batch in chunked(found_reports, FOUND_BATCH_SIZE)
+    ]
+    failed = 0
+    for future in futures:
+        try:
+            future.result()
+        except Exception as e:
+            log(f"Found batch failed: {e}", "ERROR")
+            failed += 1
+    if failed:
+        raise RuntimeError(f"{failed} of {len(futures)} found batch(es) failed")
+
+# ------------------------
+# Incremental Matching
+# ------------------------
+
+def is_unmatched(report):
+    return report.get("status") == "active" and not report.get("isMatched") and not report.get("matchedReportIds")
+
+# In-memory view of the active, unmatched reports, kept current from change
+# events and reconciled with a full read every POOL_REFRESH_SECONDS
+class ReportPool:
+    def __init__(self):
+        self.reports = {"lost": {}, "found": {}}
+        self.refreshed_at = 0
+
+    def loaded(self):
+        return self.refreshed_at > 0
+
+    # Returns the lost and found reports that were not in the pool before
+    def refresh(self):
+        log("Loading unmatched lost and found reports...", "CHECK")
+        previous = {report_type: set(pool) for report_type, pool in self.reports.items()}
+        self.reports = {
+            report_type: {str(r["_id"]): r for r in iter_unmatched_reports(report_type)}
+            for report_type in ("lost", "found")
+        }
+        self.refreshed_at = time.monotonic()
+        log(f"Loaded {len(self.reports['lost'])} lost and {len(self.reports['found'])} found", "PROCESS")
+        return tuple(
+            [r for report_id, r in self.reports[report_type].items() if report_id not in previous[report_type]]
+            for report_type in ("lost", "found")
+        )
+
+    def forget(self, reports):
+        for report in reports:
+            for pool in self.reports.values():
+                pool.pop(str(report["_id"]), None)
+
+    def needs_refresh(self):
+        return time.monotonic() - self.refreshed_at >= POOL_REFRESH_SECONDS
+
+    def lost(self):
+        return list(self.reports["lost"].values())
+
+    def found(self):
+        return list(self.reports["found"].values())
+
+    # Apply (report_id, document or None) changes; returns the changed reports
+    # that still need matching, split into lost and found
+    def apply(self, changes):
+        changed = {"lost": {}, "found": {}}
+        for report_id, doc in changes:
+            for pool in self.reports.values():
+                pool.pop(report_id, None)
+            for pending in changed.values():
+                pending.pop(report_id, None)
+            if doc is not None and is_unmatched(doc) and doc.get("reportType") in self.reports:
+                self.reports[doc["reportType"]][report_id] = doc
+                changed[doc["reportType"]][report_id] = doc
+        return list(changed["lost"].values()), list(changed["found"].values())
+
+def load_state():
+    return state_collection.find_one({"_id": "report_changes"}) or {}
+
+def save_state(**fields):
+    state_collection.update_one({"_id": "report_changes"}, {"$set": fields}, upsert=True)
+
+def relevant_change(change):
+    if change["operationType"] != "update":
+        return True
+    updated = change.get("updateDescription", {})
+    fields = list(updated.get("updatedFields", {})) + list(updated.get("removedFields", []))
+    return any(field.split(".")[0] in MATCH_FIELDS for field in fields)
+
+# Yield batches of (report_id, document) changes plus the position to persist,
+# starting with an empty batch as soon as the source is open. Changes are
+# gathered for up to CHANGE_BATCH_WINDOW seconds so bursts of new reports are
+# matched together; while idle the position is still saved every
+# POLL_INTERVAL seconds so it stays inside the oplog window.
+def change_stream_batches(resume_token):
+    # Nested projections drop fullDocument._id unless it is listed explicitly
+    pipeline = [
+        {"$match": {"operationType": {"$in": ["insert", "update", "replace", "delete"]}}},
+        {"$project": {"operationType": 1, "documentKey": 1, "updateDescription": 1, "fullDocument._id": 1,
+                      **{f"fullDocument.{field}": 1 for field in REPORT_PROJECTION}}}
+    ]
+    with reports_collection.watch(pipeline, full_document="updateLookup",
+                                  resume_after=resume_token, max_await_time_ms=1000) as stream:
+        log("Watching report changes via change stream", "WAIT")
+        yield [], {"resume_token": stream.resume_token}
+        batch, started, idle_since = [], None, time.monotonic()
+        while stream.alive:
+            change = stream.try_next()
+            if change is not None and relevant_change(change):
+                batch.append((str(change["documentKey"]["_id"]), change.get("fullDocument")))
+                started = started or time.monotonic()
+            if batch and (change is None or len(batch) >= MAX_CHANGE_BATCH
+                          or time.monotonic() - started >= CHANGE_BATCH_WINDOW):
+                yield batch, {"resume_token": stream.resume_token}
+                batch, started, idle_since = [], None, time.monotonic()
+            elif not batch and time.monotonic() - idle_since >= POLL_INTERVAL:
+                yield [], {"resume_token": stream.resume_token}
+                idle_since = time.monotonic()
 
+def updated_at_batches(since):
+    log("Change streams unavailable; polling reports on updatedAt", "WAIT")
+    yield [], {"poll_since": since}
+    while True:
+        docs = list(reports_collection.find({"updatedAt": {"$gt": since}}, REPORT_PROJECTION)
+                    .sort("updatedAt", 1).batch_size(FETCH_BATCH_SIZE))
+        if docs:
+            since = docs[-1]["updatedAt"]
+            for batch in chunked(docs, MAX_CHANGE_BATCH):
+                yield [(str(d["_id"]), d) for d in batch], {"poll_since": since}
+        else:
+            time.sleep(CHANGE_POLL_INTERVAL)
+            yield [], {}
+
+def change_batches(state):
     try:
-        client.server_info()
-        log("Connected to MongoDB", "DONE")
-    except Exception as e:
-        log(f"MongoDB connection failed: {e}", "ERROR")
-        return
+        yield from change_stream_batches(state.get("resume_token"))
+    except OperationFailure as e:
+        if e.code != 40573:  # 40573: change streams need a replica set
+            raise
+        yield from updated_at_batches(state.get("poll_since") or datetime.utcnow())
 
-    text_ready = check_service("http://localhost:5001/match-text", "Text Matching Agent")
-    image_ready = check_service("http://localhost:5002/match-image", "Image Matching Agent")
+def match_changes(pool, changed_lost, changed_found):
+    if changed_found and pool.lost():
+        match_found_reports(pool.lost(), changed_found)
+    if changed_lost and pool.found():
+        match_lost_reports(changed_lost, pool.found())
 
-    if not (text_ready and image_ready):
-        log("One or more agents unavailable. Exiting...", "ERROR")
+# Reports that entered the pool without a change event are matched too; if
+# that fails they are dropped from the pool so the next refresh retries them
+def refresh_pool(pool):
+    new_lost, new_found = pool.refresh()
+    if not (new_lost or new_found):
         return
+    log(f"Refresh found {len(new_lost)} lost and {len(new_found)} found report(s) without a change event", "PROCESS")
+    try:
+        match_changes(pool, new_lost, new_found)
+    except Exception:
+        pool.forget(new_lost + new_found)
+        raise
+
+# The change position is saved only after every agent answered for the
+# changes before it; a failure restarts from the last saved position
+def incremental_loop(pool):
+    state = load_state()
+    if state:
+        if pool.loaded():
+            refresh_pool(pool)
+        else:
+            pool.refresh()
 
+    try:
+        for changes, position in change_batches(state):
+            if not state:
+                # No saved position: the change source is open, so changes made while
+                # the current backlog is matched are delivered afterwards
+                log("No saved change position; matching the current backlog once", "PROCESS")
+                pool.refresh()
+                if pool.lost() and pool.found():
+                    match_found_reports(pool.lost(), pool.found())
+                state = position
+            elif changes:
+                changed_lost, changed_found = pool.apply(changes)
+                log(f"{len(changes)} report change(s): {len(changed_lost)} lost and {len(changed_found)} found to match", "PROCESS")
+                match_changes(pool, changed_lost, changed_found)
+            if position:
+                save_state(**position)
+            if pool.needs_refresh():
+                refresh_pool(pool)
+    except OperationFailure as e:
+        if e.code == 286:  # ChangeStreamHistoryLost: the saved position has left the oplog
+            log("Saved change position is too old; the backlog will be matched again", "ERROR")
+            state_collection.delete_one({"_id": "report_changes"})
+        raise
+
+def poll_loop():
     while True:
         log("Checking for unmatched reports...", "WAIT")
         lost_reports, found_reports = fetch_unmatched_reports()
 
         if not lost_reports or not found_reports:
-            log("No unmatched reports. Sleeping 30 seconds...", "WAIT")
-            time.sleep(30)
+            log(f"No unmatched reports. Sleeping {POLL_INTERVAL} seconds...", "WAIT")
+            time.sleep(POLL_INTERVAL)
             continue
 
-        for found in found_reports:
-            text_matches = send_to_text_matching_agent(lost_reports, found)
-            image_matches = send_to_image_matching_agent(lost_reports, found)
+        try:
+            match_found_reports(lost_reports, found_reports)
+        except Exception as e:
+            log(f"Cycle failed: {e}; retrying next cycle", "ERROR")
 
-            merged_matches = merge_and_average_matches(text_matches, image_matches)
+        log(f"Cycle complete. Sleeping {POLL_INTERVAL} seconds...\n", "WAIT")
+        time.sleep(POLL_INTERVAL)
 
-            if merged_matches:
-                update_report_matches(merged_matches)
-            else:
-                log(f"No match found for Found[{found['_id']}]", "PROCESS")
+def coordinator_loop():
+    log("Coordinator Agent starting...", "CHECK")
+
+    try:
+        client.server_info()
+        log("Connected to MongoDB", "DONE")
+    except Exception as e:
+        log(f"MongoDB connection failed: {e}", "ERROR")
+        return
+
+    text_ready = check_service(f"{TEXT_AGENT_URL}/match-text", "Text Matching Agent", "text")
+    image_ready = check_service(f"{IMAGE_AGENT_URL}/match-image", "Image Matching Agent", "image")
+
+    if not (text_ready and image_ready):
+        log("One or more agents unavailable. Exiting...", "ERROR")
+        return
+
+    ensure_report_indexes()
+    if LEDGER_ENABLED:
+        ensure_ledger_indexes()
 
-        log("Cycle complete. Sleeping 30 seconds...\n", "WAIT")
-        time.sleep(30)
+    if COORDINATOR_MODE == "incremental":
+        pool = ReportPool()
+        while True:
+            try:
+                incremental_loop(pool)
+            except Exception as e:
+                log(f"Change processing interrupted: {e}. Resuming in {POLL_INTERVAL} seconds...", "ERROR")
+                time.sleep(POLL_INTERVAL)
+    else:
+        poll_loop()
 
 if __name__ == "__main__":
     coordinator_loop()
@@ -0,0 +1,172 @@
+from collections import OrderedDict
+import numpy as np
+import threading
+import json
+import os
+
+# On-disk embedding cache shared by the matching agents.
+# Vectors live in a memory-mapped float32 matrix (vectors.f32) and a JSON
+# index maps each key to its row plus caller-supplied metadata (content hash,
+# mtime, model version, ...) used for invalidation. The index is a snapshot
+# (index.json) plus an append-only log of later changes (index.log), so a
+# flush writes only what changed; the log is folded into the snapshot once it
+# outgrows the snapshot itself.
+# LRUCache is the bounded in-memory layer agents put in front of it.
+
+INITIAL_CAPACITY = 1024
+COMPACT_MIN_RECORDS = int(os.environ.get("EMBEDDING_LOG_COMPACT_MIN", "10000"))
+
+
+class EmbeddingStore:
+    def __init__(self, directory, dim):
+        self.directory = directory
+        self.dim = dim
+        self.index_path = os.path.join(directory, "index.json")
+        self.log_path = os.path.join(directory, "index.log")
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.lock = threading.RLock()
+        self.pending = []
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        entries, capacity, self.log_records = {}, INITIAL_CAPACITY, 0
+        valid = torn = False
+        if os.path.isfile(self.index_path) and os.path.isfile(self.vectors_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+            if saved.get("dim") == self.dim:
+                valid = True
+                entries = saved.get("entries", {})
+                capacity = max(saved.get("capacity", INITIAL_CAPACITY),
+                               os.path.getsize(self.vectors_path) // (self.dim * 4))
+        if valid and os.path.isfile(self.log_path):
+            with open(self.log_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        torn = True  # interrupted write at the end of the log
+                        break
+                    if record["row"] is None:
+                        entries.pop(record["key"], None)
+                    else:
+                        entries[record["key"]] = {"row": record["row"], "meta": record["meta"]}
+                    self.log_records += 1
+
+        # Free rows are the gaps below the highest row in use
+        used = {e["row"] for e in entries.values()}
+        self.entries = entries
+        self.capacity = capacity
+        self.next_row = max(used, default=-1) + 1
+        self.free_rows = sorted(set(range(self.next_row)) - used, reverse=True)
+        self.vectors = self._open_matrix(capacity)
+        if not valid or torn:
+            self._compact()
+
+    def _open_matrix(self, capacity):
+        mode = "r+" if os.path.isfile(self.vectors_path) else "w+"
+        if mode == "r+" and os.path.getsize(self.vectors_path) < capacity * self.dim * 4:
+            with open(self.vectors_path, "ab") as f:
+                f.truncate(capacity * self.dim * 4)
+        return np.memmap(self.vectors_path, dtype=np.float32, mode=mode, shape=(capacity, self.dim))
+
+    def _allocate_row(self):
+        if self.free_rows:
+            return self.free_rows.pop()
+        if self.next_row >= self.capacity:
+            self.vectors.flush()
+            self.capacity *= 2
+            self.vectors = self._open_matrix(self.capacity)
+        row = self.next_row
+        self.next_row += 1
+        return row
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def meta(self, key):
+        entry = self.entries.get(key)
+        return entry["meta"] if entry else None
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            return np.array(self.vectors[entry["row"]])
+
+    def put(self, key, vector, meta=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            row = entry["row"] if entry else self._allocate_row()
+            self.vectors[row] = np.asarray(vector, dtype=np.float32).reshape(self.dim)
+            self.entries[key] = {"row": row, "meta": meta or {}}
+            self.pending.append({"key": key, "row": row, "meta": self.entries[key]["meta"]})
+
+    def update_meta(self, key, **changes):
+        with self.lock:
+            entry = self.entries[key]
+            entry["meta"].update(changes)
+            self.pending.append({"key": key, "row": entry["row"], "meta": entry["meta"]})
+
+    def remove(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.free_rows.append(entry["row"])
+                self.pending.append({"key": key, "row": None})
+
+    # Vectors are flushed before the log records that point at them
+    def flush(self):
+        with self.lock:
+            if not self.pending:
+                return
+            self.vectors.flush()
+            if self.log_records + len(self.pending) >= max(COMPACT_MIN_RECORDS, len(self.entries)):
+                self._compact()
+                return
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(record) + "\n" for record in self.pending))
+            self.log_records += len(self.pending)
+            self.pending = []
+
+    def _compact(self):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "capacity": self.capacity, "entries": self.entries}, f)
+        os.replace(tmp_path, self.index_path)
+        open(self.log_path, "w").close()
+        self.log_records = 0
+        self.pending = []
+
+
+class LRUCache:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.items)
+
+    def get(self, key):
+        with self.lock:
+            value = self.items.get(key)
+            if value is not None:
+                self.items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.max_size:
+                self.items.popitem(last=False)
+
+    def pop(self, key):
+        with self.lock:
+            return self.items.pop(key, None)
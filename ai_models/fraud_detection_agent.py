@@ -1,17 +1,22 @@
 from flask import Flask, jsonify
-from pymongo import MongoClient
+from pymongo import MongoClient, ReplaceOne, UpdateMany, UpdateOne
+from pymongo.errors import DuplicateKeyError
 from sklearn.ensemble import IsolationForest
-from nltk.tokenize import word_tokenize
-import nltk
+import joblib
 import numpy as np
 from datetime import datetime, timedelta
+from collections import OrderedDict
 import threading
+import socket
+import queue
+import uuid
 import time
 import warnings
+import hashlib
+import os
 
 
 warnings.filterwarnings('ignore')
-nltk.download('punkt')
 
 app = Flask(__name__)
 
@@ -20,40 +25,169 @@ client = MongoClient("mongodb://100.65.0.126:27017/")
 db = client["Lost_Found_new"]
 reports_col = db["reports"]
 users_col = db["users"]
+features_col = db["user_fraud_features"]
+locks_col = db["agent_locks"]
+
+# Report and user updates are sent as unordered bulk writes of this size
+WRITE_BATCH_SIZE = int(os.environ.get("FRAUD_WRITE_BATCH", "1000"))
 
 # ------------------------
 # Feature Extraction
 # ------------------------
 
-def extract_user_features(user_reports):
-    now = datetime.utcnow()
-    last_week = now - timedelta(days=7)
-
-    report_dates = [
-        r["locationDetails"].get("reportedDate")
-        for r in user_reports
-        if "locationDetails" in r and "reportedDate" in r
+# Tokens the way word_tokenize counts them: runs of word characters and
+# single punctuation marks. (*UCP) makes Mongo's PCRE treat \w and \s as
+# Unicode classes, otherwise every Arabic letter counts as a token.
+TOKEN_PATTERN = r"(*UCP)\w+|[^\w\s]"
+
+# Each user's features are kept in user_fraud_features and updated from new
+# (unchecked) reports only, so a pass costs O(new reports) and the features
+# cover the user's whole history:
+#   report_count, token_sum      -> average description length
+#   description_hashes           -> duplicates against every earlier report
+#   daily_reports {day: count}   -> report counts over several horizons
+#   last_report_id               -> newest report folded in so far
+# Days come from createdAt (server-side, as "%Y-%m-%d", UTC), so horizons
+# are whole calendar days counted from today: reports_today covers reports
+# since midnight UTC. Window counts are computed for many users at once on
+# datetime64 arrays.
+WINDOW_HORIZONS = {"reports_today": 1, "report_frequency": 7, "reports_30d": 30}
+FEATURE_WINDOW_DAYS = max(WINDOW_HORIZONS.values())
+
+# New reports grouped per user (and per day inside the user), with their
+# token counts and normalized descriptions. last_report_id bounds the
+# write-back so reports created mid-pass wait for the next one. Reports up
+# to the user's stored last_report_id were already folded into the features
+# (a pass that failed before flagging them) and only count as unchecked.
+def new_report_pipeline():
+    description = {"$toLower": {"$trim": {"input": {"$ifNull": ["$itemDetails.description", ""]}}}}
+    return [
+        {"$match": {"fraud_checked": {"$exists": False}, "userId": {"$ne": None}}},
+        {"$lookup": {
+            "from": features_col.name,
+            "let": {"user": "$userId"},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$_id", "$$user"]}}},
+                {"$project": {"_id": 0, "last_report_id": 1}}
+            ],
+            "as": "folded"
+        }},
+        {"$project": {
+            "userId": 1,
+            "day": {"$dateToString": {"format": "%Y-%m-%d", "date": {"$ifNull": ["$createdAt", {"$toDate": "$_id"}]}}},
+            "description": description,
+            "tokens": {"$size": {"$regexFindAll": {"input": description, "regex": TOKEN_PATTERN}}},
+            "fresh": {"$gt": ["$_id", {"$ifNull": [{"$arrayElemAt": ["$folded.last_report_id", 0]}, None]}]}
+        }},
+        {"$group": {
+            "_id": {"user": "$userId", "day": "$day"},
+            "reports": {"$sum": {"$cond": ["$fresh", 1, 0]}},
+            "tokens": {"$sum": {"$cond": ["$fresh", "$tokens", 0]}},
+            "descriptions": {"$push": {"$cond": ["$fresh", "$description", None]}},
+            "last_report_id": {"$max": "$_id"}
+        }},
+        {"$group": {
+            "_id": "$_id.user",
+            "days": {"$push": {"day": "$_id.day", "reports": "$reports"}},
+            "reports": {"$sum": "$reports"},
+            "tokens": {"$sum": "$tokens"},
+            "descriptions": {"$push": "$descriptions"},
+            "last_report_id": {"$max": "$last_report_id"}
+        }}
     ]
-    report_count_week = sum(
-        1 for date in report_dates
-        if datetime.strptime(date, "%Y-%m-%d") >= last_week
-    )
 
-    avg_description_len = np.mean([
-        len(word_tokenize(r["itemDetails"].get("description", "")))
-        for r in user_reports
-    ]) if user_reports else 0
+def description_hash(description):
+    return hashlib.sha1(description.encode("utf-8")).hexdigest()
 
-    descriptions = [r["itemDetails"].get("description", "").strip().lower() for r in user_reports]
-    duplicate_text_flag = 1 if len(set(descriptions)) < len(descriptions) else 0
-    high_frequency_flag = 1 if report_count_week > 5 else 0
+def empty_user_features(uid):
+    return {
+        "_id": uid,
+        "report_count": 0,
+        "token_sum": 0,
+        "duplicate_count": 0,
+        "description_hashes": [],
+        "daily_reports": {},
+        "last_report_id": None
+    }
 
+# Fold one user's new reports into their stored features
+def merge_new_reports(doc, delta, now):
+    hashes = set(doc["description_hashes"])
+    for descriptions in delta["descriptions"]:
+        for description in descriptions:
+            if description is None:
+                continue  # folded by an earlier pass
+            digest = description_hash(description)
+            if digest in hashes:
+                doc["duplicate_count"] += 1
+            hashes.add(digest)
+    doc["description_hashes"] = sorted(hashes)
+    doc["report_count"] += delta["reports"]
+    doc["token_sum"] += delta["tokens"]
+
+    oldest = (now - timedelta(days=FEATURE_WINDOW_DAYS)).strftime("%Y-%m-%d")
+    daily = {day: count for day, count in doc["daily_reports"].items() if day >= oldest}
+    for bucket in delta["days"]:
+        if bucket["reports"] and bucket["day"] >= oldest:
+            daily[bucket["day"]] = daily.get(bucket["day"], 0) + bucket["reports"]
+    doc["daily_reports"] = daily
+    folded = doc.get("last_report_id")
+    doc["last_report_id"] = max(folded, delta["last_report_id"]) if folded else delta["last_report_id"]
+    doc["updated_at"] = now
+    return doc
+
+# Reports per user within each horizon, counted from today back; one
+# bincount per horizon over every (user, day) bucket of the given documents
+def window_counts(docs, now):
+    owners, days, counts = [], [], []
+    for i, doc in enumerate(docs):
+        for day, count in doc["daily_reports"].items():
+            owners.append(i)
+            days.append(day)
+            counts.append(count)
+    age = (np.datetime64(now.date(), "D") - np.array(days, dtype="datetime64[D]")).astype(np.int64)
+    counts = np.array(counts, dtype=np.float64)
     return {
-        "report_frequency": report_count_week,
-        "avg_description_length": avg_description_len,
-        "duplicate_text_flag": duplicate_text_flag,
-        "high_frequency_flag": high_frequency_flag
+        name: np.bincount(np.array(owners, dtype=np.int64), weights=counts * ((age >= 0) & (age < horizon)),
+                          minlength=len(docs)).astype(np.int64)
+        for name, horizon in WINDOW_HORIZONS.items()
+    }
+
+def user_features(docs, now):
+    windows = window_counts(docs, now)
+    report_count = np.array([doc["report_count"] for doc in docs], dtype=np.float64)
+    token_sum = np.array([doc["token_sum"] for doc in docs], dtype=np.float64)
+    avg_description_length = token_sum / np.maximum(report_count, 1)
+    return [{
+        "reports_today": int(windows["reports_today"][i]),
+        "report_frequency": int(windows["report_frequency"][i]),
+        "reports_30d": int(windows["reports_30d"][i]),
+        "avg_description_length": float(avg_description_length[i]),
+        "duplicate_text_flag": 1 if doc["duplicate_count"] else 0,
+        "high_frequency_flag": 1 if windows["report_frequency"][i] > 5 else 0
+    } for i, doc in enumerate(docs)]
+
+def load_feature_docs(user_ids):
+    docs = {}
+    for i in range(0, len(user_ids), WRITE_BATCH_SIZE):
+        for doc in features_col.find({"_id": {"$in": user_ids[i:i + WRITE_BATCH_SIZE]}}):
+            docs[doc["_id"]] = doc
+    return docs
+
+# Returns (user id, features, last_report_id) for every user with new reports
+# and their updated feature documents, persisted once they are scored
+def extract_user_features():
+    now = datetime.utcnow()
+    deltas = list(reports_col.aggregate(new_report_pipeline(), allowDiskUse=True))
+    docs = load_feature_docs([delta["_id"] for delta in deltas])
+
+    updated = {
+        delta["_id"]: merge_new_reports(docs.get(delta["_id"]) or empty_user_features(delta["_id"]), delta, now)
+        for delta in deltas
     }
+    features = user_features([updated[delta["_id"]] for delta in deltas], now)
+    users = [(delta["_id"], f, delta["last_report_id"]) for delta, f in zip(deltas, features)]
+    return users, updated
 
 def generate_fraud_reason(features):
     reasons = []
@@ -69,88 +203,324 @@ def generate_fraud_reason(features):
 # Detection
 # ------------------------
 
-def detect_fraud(feature_list):
-    matrix = np.array([
-        [
-            f["report_frequency"],
-            f["avg_description_length"],
-            f["duplicate_text_flag"],
-            f["high_frequency_flag"]
-        ] for f in feature_list
-    ])
-    model = IsolationForest(contamination=0.2, random_state=42)
-    model.fit(matrix)
-    return model.predict(matrix)
+FEATURE_NAMES = [
+    "reports_today", "report_frequency", "reports_30d",
+    "avg_description_length", "duplicate_text_flag", "high_frequency_flag"
+]
+
+def feature_matrix(feature_list):
+    return np.array([[f[name] for name in FEATURE_NAMES] for f in feature_list], dtype=np.float64).reshape(-1, len(FEATURE_NAMES))
 
 # ------------------------
-# Main Detection Function
+# Model Management
 # ------------------------
 
-def run_fraud_detection():
+# The IsolationForest is trained on the features of every user active within
+# FEATURE_WINDOW_DAYS (dormant users have all-zero window counts and would
+# make every active user look like an outlier) and saved with a version;
+# passes only score the users with new reports. It is retrained when missing,
+# older than FRAUD_MODEL_MAX_AGE_HOURS, or when a fresh snapshot of the active
+# population, taken at most every FRAUD_DRIFT_CHECK_MINUTES, has drifted from
+# the training snapshot.
+MODEL_PATH = os.environ.get(
+    "FRAUD_MODEL_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "fraud_model.joblib")
+)
+CONTAMINATION = float(os.environ.get("FRAUD_CONTAMINATION", "0.2"))
+MODEL_MAX_AGE_HOURS = float(os.environ.get("FRAUD_MODEL_MAX_AGE_HOURS", "24"))
+DRIFT_THRESHOLD = float(os.environ.get("FRAUD_DRIFT_THRESHOLD", "1.0"))
+DRIFT_MIN_SAMPLES = int(os.environ.get("FRAUD_DRIFT_MIN_SAMPLES", "20"))
+DRIFT_CHECK_MINUTES = float(os.environ.get("FRAUD_DRIFT_CHECK_MINUTES", "60"))
+MIN_TRAINING_USERS = int(os.environ.get("FRAUD_MIN_TRAINING_USERS", "2"))
+TRAIN_JOBS = int(os.environ.get("FRAUD_TRAIN_JOBS", "1"))
+SCORE_BATCH_SIZE = int(os.environ.get("FRAUD_SCORE_BATCH", "5000"))
+
+_fraud_model = {"model": None, "version": 0, "trained_at": None, "users": 0, "features": None, "mean": None, "std": None}
+_fraud_model_lock = threading.RLock()
+_drift_check = {"checked_at": None, "score": None}
+
+def load_fraud_model():
+    if not os.path.isfile(MODEL_PATH):
+        return
     try:
-        print("🛡️ Running fraud detection on ALL users...")
+        saved = joblib.load(MODEL_PATH)
+        _fraud_model.update(saved)
+        print(f"📦 Loaded fraud model v{saved['version']} trained on {saved['users']} user(s) at {saved['trained_at']}")
+    except Exception as e:
+        print(f"❌ Could not load fraud model {MODEL_PATH}: {e}")
+
+def save_fraud_model():
+    os.makedirs(os.path.dirname(MODEL_PATH), exist_ok=True)
+    tmp_path = MODEL_PATH + ".tmp"
+    joblib.dump(dict(_fraud_model), tmp_path)
+    os.replace(tmp_path, MODEL_PATH)
 
-        user_ids = reports_col.distinct("userId")
-        user_features = []
-        valid_user_ids = []
+def ensure_feature_indexes():
+    features_col.create_index([("updated_at", 1)], name="updated_at")
 
-        for uid in user_ids:
-            reports = list(reports_col.find({
-                "userId": uid,
-                "fraud_checked": {"$exists": False}
-            }))
+# Feature matrix of every user with reports in the last FEATURE_WINDOW_DAYS,
+# with this pass's not-yet-saved documents taking the place of their stored versions
+def active_population(pending_docs):
+    now = datetime.utcnow()
+    docs = list(pending_docs.values())
+    docs.extend(features_col.find({
+        "_id": {"$nin": list(pending_docs)},
+        "updated_at": {"$gte": now - timedelta(days=FEATURE_WINDOW_DAYS)}
+    }).batch_size(WRITE_BATCH_SIZE))
+    return feature_matrix(user_features(docs, now))
+
+def train_fraud_model(pending_docs, reason, matrix=None):
+    if matrix is None:
+        matrix = active_population(pending_docs)
+    if len(matrix) < MIN_TRAINING_USERS:
+        print(f"⏳ Not training fraud model: {len(matrix)} user(s), need {MIN_TRAINING_USERS}")
+        return False
+    started = time.perf_counter()
+    model = IsolationForest(contamination=CONTAMINATION, random_state=42, n_jobs=TRAIN_JOBS).fit(matrix)
+    with _fraud_model_lock:
+        _fraud_model.update({
+            "model": model,
+            "version": _fraud_model["version"] + 1,
+            "trained_at": datetime.utcnow(),
+            "users": len(matrix),
+            "features": FEATURE_NAMES,
+            "mean": matrix.mean(axis=0),
+            "std": matrix.std(axis=0)
+        })
+        save_fraud_model()
+        _drift_check.update(checked_at=datetime.utcnow(), score=0.0)
+    print(f"🧪 Trained fraud model v{_fraud_model['version']} on {len(matrix)} user(s) "
+          f"in {time.perf_counter() - started:.2f}s ({reason})")
+    return True
+
+# Mean shift of a population snapshot in training standard deviations,
+# averaged over the features that varied in training (constant ones have no scale)
+def drift_score(matrix):
+    varying = _fraud_model["std"] > 0
+    if not varying.any():
+        return 0.0
+    shift = np.abs(matrix.mean(axis=0) - _fraud_model["mean"])[varying] / _fraud_model["std"][varying]
+    return float(shift.mean())
+
+# Returns why the model needs training (or None), plus the population
+# snapshot when one was taken for the drift check
+def training_reason(pending_docs):
+    now = datetime.utcnow()
+    if _fraud_model["model"] is None:
+        return "no model", None
+    if _fraud_model.get("features") != FEATURE_NAMES:
+        return "feature set changed", None
+    if now - _fraud_model["trained_at"] > timedelta(hours=MODEL_MAX_AGE_HOURS):
+        return "model expired", None
+    checked_at = _drift_check["checked_at"]
+    if checked_at and now - checked_at < timedelta(minutes=DRIFT_CHECK_MINUTES):
+        return None, None
+    matrix = active_population(pending_docs)
+    drift = drift_score(matrix) if len(matrix) >= DRIFT_MIN_SAMPLES else None
+    _drift_check.update(checked_at=now, score=drift)
+    if drift is not None and drift > DRIFT_THRESHOLD:
+        return f"feature drift {drift:.2f}", matrix
+    return None, None
+
+# ------------------------
+# Detection
+# ------------------------
 
-            if not reports:
-                continue
+# Returns one prediction per feature vector (-1 = fraud) and the model version;
+# without a trained model every user is treated as clean
+def detect_fraud(feature_list, pending_docs):
+    matrix = feature_matrix(feature_list)
+    with _fraud_model_lock:
+        reason, snapshot = training_reason(pending_docs)
+        if reason:
+            train_fraud_model(pending_docs, reason, snapshot)
+        model, version = _fraud_model["model"], _fraud_model["version"]
+    if model is None:
+        return np.ones(len(matrix), dtype=int), None
+    predictions = [model.predict(matrix[i:i + SCORE_BATCH_SIZE]) for i in range(0, len(matrix), SCORE_BATCH_SIZE)]
+    return np.concatenate(predictions), version
 
-            features = extract_user_features(reports)
-            user_features.append(features)
-            valid_user_ids.append(uid)
+# ------------------------
+# Main Detection Function
+# ------------------------
 
-        if not user_features:
-            print("✅ No new reports to check.")
-            return
+def write_in_batches(collection, operations):
+    for i in range(0, len(operations), WRITE_BATCH_SIZE):
+        collection.bulk_write(operations[i:i + WRITE_BATCH_SIZE], ordered=False)
 
-        predictions = detect_fraud(user_features)
-
-        for i, pred in enumerate(predictions):
-            uid = valid_user_ids[i]
-            features = user_features[i]
-            reason = generate_fraud_reason(features)
-            is_fraud = bool(pred == -1)
-
-            # Update user's reports
-            reports_col.update_many(
-                {"userId": uid, "fraud_checked": {"$exists": False}},
-                {
-                    "$set": {
-                        "fraud": is_fraud,
-                        "fraud_checked": True,
-                        "fraud_reason": reason if is_fraud else ""
-                    }
+# Returns the number of users checked; errors propagate to the job runner
+def run_fraud_detection():
+    print("🛡️ Running fraud detection on ALL users...")
+    started = time.perf_counter()
+
+    users, updated_docs = extract_user_features()
+    if not users:
+        print("✅ No new reports to check.")
+        return 0
+
+    predictions, model_version = detect_fraud([features for _, features, _ in users], updated_docs)
+    if model_version is None:
+        # Nothing to score with yet: fold the features in but leave the
+        # reports unchecked so they are scored once a model is trained
+        write_in_batches(features_col, [ReplaceOne({"_id": uid}, doc, upsert=True) for uid, doc in updated_docs.items()])
+        print(f"⏳ No fraud model yet; {len(users)} user(s) left unscored")
+        return 0
+
+    report_updates, user_updates = [], []
+    for (uid, features, last_report_id), pred in zip(users, predictions):
+        reason = generate_fraud_reason(features)
+        is_fraud = bool(pred == -1)
+
+        # User's reports and profile
+        report_updates.append(UpdateMany(
+            {"userId": uid, "fraud_checked": {"$exists": False}, "_id": {"$lte": last_report_id}},
+            {
+                "$set": {
+                    "fraud": is_fraud,
+                    "fraud_checked": True,
+                    "fraud_reason": reason if is_fraud else "",
+                    "fraud_model_version": model_version
                 }
-            )
+            }
+        ))
+        user_updates.append(UpdateOne({"_id": uid}, {"$set": {"fraudUser": is_fraud}}, upsert=True))
 
-            # Update user profile
-            users_col.update_one(
-                {"_id": uid},
-                {"$set": {"fraudUser": is_fraud}},
-                upsert=True
-            )
+        print(f"{'🚨' if is_fraud else '🔍'} User {uid} flagged as {'FRAUD' if is_fraud else 'CLEAN'} | Reason: {reason if is_fraud else 'N/A'}")
 
-            print(f"{'🚨' if is_fraud else '🔍'} User {uid} flagged as {'FRAUD' if is_fraud else 'CLEAN'} | Reason: {reason if is_fraud else 'N/A'}")
-
-    except Exception as e:
-        print(f"❌ Error during fraud detection: {e}")
+    # Features go first; their last_report_id keeps a retry after a failure
+    # below from folding the same reports in twice
+    write_in_batches(features_col, [ReplaceOne({"_id": uid}, doc, upsert=True) for uid, doc in updated_docs.items()])
+    write_in_batches(reports_col, report_updates)
+    write_in_batches(users_col, user_updates)
+    print(f"✅ Checked {len(users)} user(s) in {time.perf_counter() - started:.2f}s")
+    return len(users)
 
 # ------------------------
-# Background Thread
+# Job Runner
 # ------------------------
 
+# Detection passes and manual model training run one at a time on a single
+# worker thread, whether they come from the schedule or the API. A request
+# while a job of the same task is already queued joins that job instead of
+# queueing another. With FRAUD_JOB_LEASE=1 the worker also holds a lease in
+# Mongo, renewed while the job runs, so replicas of the agent never overlap.
+CHECK_INTERVAL = int(os.environ.get("FRAUD_CHECK_INTERVAL", "30"))
+USE_LEASE = os.environ.get("FRAUD_JOB_LEASE", "0") == "1"
+LEASE_SECONDS = int(os.environ.get("FRAUD_LEASE_SECONDS", "600"))
+JOB_HISTORY = int(os.environ.get("FRAUD_JOB_HISTORY", "100"))
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+jobs = OrderedDict()
+job_queue = queue.Queue()
+_jobs_lock = threading.Lock()
+
+def run_training():
+    trained = train_fraud_model({}, "manual")
+    return {"trained": trained, "model_version": _fraud_model["version"]}
+
+# Each task returns the result fields recorded on its job
+JOB_TASKS = {
+    "detect": lambda: {"users_processed": run_fraud_detection()},
+    "train": run_training
+}
+
+def submit_job(trigger, task="detect"):
+    with _jobs_lock:
+        for job in jobs.values():
+            if job["status"] == "queued" and job["task"] == task:
+                return job
+        job = {
+            "id": uuid.uuid4().hex,
+            "task": task,
+            "trigger": trigger,
+            "status": "queued",
+            "queued_at": datetime.utcnow(),
+            "started_at": None,
+            "finished_at": None,
+            "duration": None,
+            "error": None
+        }
+        jobs[job["id"]] = job
+        while len(jobs) > JOB_HISTORY:
+            jobs.popitem(last=False)
+    job_queue.put(job["id"])
+    return job
+
+def acquire_lease():
+    now = datetime.utcnow()
+    try:
+        locks_col.find_one_and_update(
+            {"_id": "fraud_detection", "$or": [{"expires_at": {"$lt": now}}, {"owner": WORKER_ID}]},
+            {"$set": {"owner": WORKER_ID, "expires_at": now + timedelta(seconds=LEASE_SECONDS)}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        # Held by another replica: the filter missed and the upsert collided
+        return False
+
+def release_lease():
+    locks_col.delete_one({"_id": "fraud_detection", "owner": WORKER_ID})
+
+# Extends the lease every third of its length until stopped or lost
+def keep_lease(stop):
+    while not stop.wait(LEASE_SECONDS / 3):
+        try:
+            renewed = locks_col.update_one(
+                {"_id": "fraud_detection", "owner": WORKER_ID},
+                {"$set": {"expires_at": datetime.utcnow() + timedelta(seconds=LEASE_SECONDS)}}
+            ).matched_count
+        except Exception as e:
+            print(f"❌ Could not renew the fraud detection lease: {e}")
+            continue
+        if not renewed:
+            print("❌ Fraud detection lease was lost; another replica may start a job")
+            return
+
+def run_job(job):
+    stop_renewing = threading.Event()
+    leased = False
+    started = time.perf_counter()
+    try:
+        if USE_LEASE:
+            leased = acquire_lease()
+            if not leased:
+                job.update(status="skipped", error="another replica holds the lease")
+                print(f"⏭️ Fraud {job['task']} job skipped: another replica is running one")
+                return
+            threading.Thread(target=keep_lease, args=(stop_renewing,), daemon=True).start()
+        job.update(status="running", started_at=datetime.utcnow())
+        job.update(JOB_TASKS[job["task"]]())
+        job["status"] = "succeeded"
+    except Exception as e:
+        print(f"❌ Error during fraud {job['task']} job: {e}")
+        job.update(status="failed", error=str(e))
+    finally:
+        job.update(finished_at=datetime.utcnow(), duration=round(time.perf_counter() - started, 3))
+        stop_renewing.set()
+        if leased:
+            try:
+                release_lease()
+            except Exception as e:
+                print(f"❌ Error releasing fraud job lease: {e}")
+
+# One bad job must not stop the worker thread
+def job_worker():
+    while True:
+        try:
+            job = jobs.get(job_queue.get())
+            if job is not None:
+                run_job(job)
+        except Exception as e:
+            print(f"❌ Fraud job worker error: {e}")
+
 def periodic_checker():
     while True:
-        run_fraud_detection()
-        time.sleep(30)
+        submit_job("schedule")
+        time.sleep(CHECK_INTERVAL)
+
+def job_view(job):
+    return {k: v.isoformat() if isinstance(v, datetime) else v for k, v in job.items()}
 
 # ------------------------
 # Flask Endpoint (Optional)
@@ -158,13 +528,45 @@ def periodic_checker():
 
 @app.route('/run_fraud_detection', methods=['POST'])
 def trigger_fraud_check():
-    run_fraud_detection()
-    return jsonify({"message": "Fraud detection triggered manually"}), 200
+    job = submit_job("api")
+    return jsonify({"message": "Fraud detection queued", "job": job_view(job)}), 202
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    with _jobs_lock:
+        recent = [job_view(job) for job in reversed(jobs.values())]
+    return jsonify({"jobs": recent}), 200
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "unknown job"}), 404
+    return jsonify(job_view(job)), 200
+
+@app.route('/fraud-model', methods=['GET'])
+def fraud_model_status():
+    return jsonify({
+        "version": _fraud_model["version"],
+        "trained": _fraud_model["model"] is not None,
+        "trained_at": _fraud_model["trained_at"].isoformat() if _fraud_model["trained_at"] else None,
+        "users": _fraud_model["users"],
+        "drift_checked_at": _drift_check["checked_at"].isoformat() if _drift_check["checked_at"] else None,
+        "drift": _drift_check["score"]
+    }), 200
+
+@app.route('/fraud-model/train', methods=['POST'])
+def retrain_fraud_model():
+    job = submit_job("api", task="train")
+    return jsonify({"message": "Fraud model training queued", "job": job_view(job)}), 202
 
 # ------------------------
 # Start Background Thread
 # ------------------------
 
 if __name__ == '__main__':
+    ensure_feature_indexes()
+    load_fraud_model()
+    threading.Thread(target=job_worker, daemon=True).start()
     threading.Thread(target=periodic_checker, daemon=True).start()
     app.run(host='0.0.0.0', port=5003)
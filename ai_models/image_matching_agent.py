@@ -3,91 +3,551 @@ from PIL import Image
 from datetime import datetime
 from torchvision import models, transforms
 import torch
+from agent_resources import OFFLINE
+from embedding_store import EmbeddingStore
+from vector_index import ReportIndex
+from index_routes import register_index_routes
+from blocking import blocking_keys, index_filter
+import score_matrix
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
 import numpy as np
+import threading
+import io
+import hashlib
+import time
 import os
 
 app = Flask(__name__)
 
+# Optional fine-tuned weights; when unset the ImageNet weights are used
+MODEL_WEIGHTS_PATH = os.environ.get("IMAGE_MODEL_WEIGHTS")
+PRELOAD_MODEL = os.environ.get("IMAGE_MODEL_PRELOAD", "1") == "1"
+EMBEDDING_CACHE_DIR = os.environ.get(
+    "IMAGE_EMBEDDING_CACHE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "image_embeddings")
+)
+FEATURE_DIM = 512
+
+# Images ingested by id are kept as 224x224 PNG thumbnails next to their
+# embeddings, so they can be re-embedded after a model change without the originals
+THUMBNAIL_DIR = os.environ.get(
+    "IMAGE_THUMBNAIL_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "image_thumbnails")
+)
+
+# Index of active lost-report image embeddings ("flat" is exact, "hnsw" needs hnswlib)
+INDEX_BACKEND = os.environ.get("IMAGE_INDEX_BACKEND", "flat")
+INDEX_DIR = os.environ.get(
+    "IMAGE_INDEX_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "image_index")
+)
+DEFAULT_TOP_K = int(os.environ.get("IMAGE_INDEX_TOP_K", "20"))
+
+# Batch embedding pipeline settings
+BATCH_SIZE = int(os.environ.get("IMAGE_BATCH_SIZE", "32"))
+DECODE_WORKERS = int(os.environ.get("IMAGE_DECODE_WORKERS", "4"))
+PREFETCH_BATCHES = int(os.environ.get("IMAGE_PREFETCH_BATCHES", "2"))
+TORCH_THREADS = int(os.environ.get("IMAGE_TORCH_THREADS", "0"))  # 0 keeps torch's default
+
+if TORCH_THREADS > 0:
+    torch.set_num_threads(TORCH_THREADS)
+
 # Logging utility
 def log(message):
     print(f"🧠 [Image Matching Agent] {message}")
 
 # Load pretrained ResNet-18 as a feature extractor
-def get_feature_extractor():
-    model = models.resnet18(pretrained=True)
+def get_feature_extractor(weights_path=None):
+    model = models.resnet18(pretrained=weights_path is None)
+    if weights_path:
+        model.load_state_dict(torch.load(weights_path, map_location="cpu"))
     model = torch.nn.Sequential(*(list(model.children())[:-1]))  # remove classification head
     model.eval()
     return model
 
+# ------------------------
+# Model Lifecycle
+# ------------------------
+
+# The extractor is built once per process and swapped atomically on reload,
+# so requests only pay for inference.
+_model_state = {
+    "model": None,
+    "version": None,
+    "weights_mtime": None,
+    "loaded_at": None,
+    "load_seconds": None,
+    "warm": False
+}
+_model_lock = threading.RLock()
+
+def _weights_mtime():
+    if MODEL_WEIGHTS_PATH and os.path.isfile(MODEL_WEIGHTS_PATH):
+        return os.path.getmtime(MODEL_WEIGHTS_PATH)
+    return None
+
+def model_version():
+    mtime = _weights_mtime()
+    return f"resnet18:{int(mtime)}" if mtime is not None else "resnet18:imagenet"
+
+def load_model():
+    with _model_lock:
+        started = time.perf_counter()
+        mtime = _weights_mtime()
+        model = get_feature_extractor(MODEL_WEIGHTS_PATH if mtime is not None else None)
+        elapsed = time.perf_counter() - started
+        _model_state.update({
+            "model": model,
+            "version": model_version(),
+            "weights_mtime": mtime,
+            "loaded_at": datetime.now().isoformat(),
+            "load_seconds": round(elapsed, 3),
+            "warm": False
+        })
+    log(f"📦 Feature extractor loaded ({_model_state['version']}) in {elapsed:.2f}s")
+    return model
+
+def get_model():
+    model = _model_state["model"]
+    if model is not None:
+        return model
+    with _model_lock:
+        if _model_state["model"] is None:
+            load_model()
+        return _model_state["model"]
+
+def warm_up():
+    model = get_model()
+    started = time.perf_counter()
+    with torch.inference_mode():
+        model(torch.zeros(1, 3, 224, 224))
+    _model_state["warm"] = True
+    elapsed = time.perf_counter() - started
+    log(f"🔥 Warm-up pass completed in {elapsed:.3f}s")
+    return elapsed
+
+def reload_if_changed(force=False):
+    if not force and _weights_mtime() == _model_state["weights_mtime"]:
+        return False
+    load_model()
+    warm_up()
+    reset_index()
+    return True
+
 # Preprocess image for model input
-def preprocess_image(image_path):
-    transform = transforms.Compose([
-        transforms.Resize((224, 224)),
-        transforms.ToTensor()
-    ])
+RESIZE = transforms.Resize((224, 224))
+TO_TENSOR = transforms.ToTensor()
+TRANSFORM = transforms.Compose([RESIZE, TO_TENSOR])
+
+# ------------------------
+# Embedding Cache
+# ------------------------
+
+# Embeddings are keyed by image path and validated against the file's
+# mtime/size (cheap) and content hash (only when the stat changed), so each
+# image goes through the CNN once until it is replaced on disk.
+embedding_store = EmbeddingStore(EMBEDDING_CACHE_DIR, FEATURE_DIM)
+
+def file_hash(image_path):
+    digest = hashlib.sha1()
+    with open(image_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def cached_features(image_path, stat):
+    meta = embedding_store.meta(image_path)
+    if meta is None or meta.get('model_version') != _model_state["version"]:
+        return None, None
+    if meta.get('mtime') == stat.st_mtime and meta.get('size') == stat.st_size:
+        return embedding_store.get(image_path), meta.get('hash')
+    content_hash = file_hash(image_path)
+    if meta.get('hash') == content_hash:
+        embedding_store.update_meta(image_path, mtime=stat.st_mtime, size=stat.st_size)
+        return embedding_store.get(image_path), content_hash
+    return None, content_hash
+
+# Read, hash and decode one image; runs on the decode pool
+def load_image(image_path):
     try:
-        image = Image.open(image_path).convert('RGB')
-        return transform(image).unsqueeze(0)
+        with open(image_path, 'rb') as f:
+            data = f.read()
+        image = Image.open(io.BytesIO(data)).convert('RGB')
+        return TRANSFORM(image), hashlib.sha1(data).hexdigest()
     except Exception as e:
         log(f"❌ Error processing image {image_path}: {e}")
-        return None
+        return None, None
 
-# Extract image feature vector
-def extract_features(image_path, model):
-    if not os.path.isfile(image_path):
-        log(f"❌ File does not exist: {image_path}")
-        return None
-    image_tensor = preprocess_image(image_path)
-    if image_tensor is None:
+decode_pool = ThreadPoolExecutor(max_workers=DECODE_WORKERS, thread_name_prefix="image-decode")
+
+# Yield (paths, tensors, hashes) batches while the pool decodes the next ones
+def decoded_batches(image_paths):
+    window = BATCH_SIZE * max(PREFETCH_BATCHES, 1)
+    pending = deque()
+    for image_path in image_paths:
+        pending.append((image_path, decode_pool.submit(load_image, image_path)))
+        if len(pending) >= window:
+            yield _collect([pending.popleft() for _ in range(BATCH_SIZE)])
+    while pending:
+        yield _collect([pending.popleft() for _ in range(min(BATCH_SIZE, len(pending)))])
+
+def _collect(batch):
+    paths, tensors, hashes = [], [], []
+    for image_path, future in batch:
+        tensor, content_hash = future.result()
+        if tensor is not None:
+            paths.append(image_path)
+            tensors.append(tensor)
+            hashes.append(content_hash)
+    return paths, tensors, hashes
+
+# Embed many images: cache hits are served from the store, misses are
+# decoded in parallel and pushed through the CNN in full batches
+def embed_images(image_paths, model):
+    features, misses, stats = {}, [], {}
+    for image_path in dict.fromkeys(image_paths):
+        if not os.path.isfile(image_path):
+            log(f"❌ File does not exist: {image_path}")
+            continue
+        stat = os.stat(image_path)
+        vec, _ = cached_features(image_path, stat)
+        if vec is not None:
+            features[image_path] = vec
+        else:
+            misses.append(image_path)
+            stats[image_path] = stat
+
+    if misses:
+        hits = len(features)
+        started = time.perf_counter()
+        for paths, tensors, hashes in decoded_batches(misses):
+            if not tensors:
+                continue
+            with torch.inference_mode():
+                batch_features = model(torch.stack(tensors)).flatten(1).numpy()
+            for image_path, vec, content_hash in zip(paths, batch_features, hashes):
+                stat = stats[image_path]
+                embedding_store.put(image_path, vec, {
+                    'mtime': stat.st_mtime,
+                    'size': stat.st_size,
+                    'hash': content_hash,
+                    'model_version': _model_state["version"]
+                })
+                features[image_path] = vec
+        elapsed = time.perf_counter() - started
+        log(f"🧮 Embedded {len(misses)} new image(s) in {elapsed:.2f}s ({hits} cached)")
+    return features
+
+# ------------------------
+# Image Ingest
+# ------------------------
+
+# The coordinator uploads each report image once under an id (its stored
+# name); matching requests then carry image_ids instead of share paths.
+# Ingest keeps a downscaled thumbnail and the embedding under "id:<image_id>",
+# along with the content hash and the signature (mtime/size) of the source
+# file, so a file replaced on the share is uploaded again.
+os.makedirs(THUMBNAIL_DIR, exist_ok=True)
+
+def image_key(image_id):
+    return f"id:{image_id}"
+
+def thumbnail_path(image_id):
+    return os.path.join(THUMBNAIL_DIR, hashlib.sha1(image_id.encode('utf-8')).hexdigest() + '.png')
+
+# Decode, downscale and store one uploaded image; runs on the decode pool
+def store_thumbnail(image_id, data):
+    try:
+        image = RESIZE(Image.open(io.BytesIO(data)).convert('RGB'))
+        image.save(thumbnail_path(image_id), format='PNG')
+        return TO_TENSOR(image)
+    except Exception as e:
+        log(f"❌ Error ingesting image {image_id}: {e}")
         return None
-    with torch.no_grad():
-        features = model(image_tensor)
-    return features.squeeze().numpy()
 
-# Cosine similarity for feature vectors
-def cosine_similarity(vec1, vec2):
-    if vec1 is None or vec2 is None:
-        return 0.0
-    return np.dot(vec1, vec2) / (np.linalg.norm(vec1) * np.linalg.norm(vec2))
+# items holds (image_id, bytes, signature); returns the counts, the failed ids
+# and the content hash of every stored or unchanged image
+def ingest_images(items, model):
+    version = _model_state["version"]
+    pending, skipped, hashes = [], 0, {}
+    for image_id, data, signature in items:
+        content_hash = hashlib.sha1(data).hexdigest()
+        meta = embedding_store.meta(image_key(image_id))
+        if meta and meta.get('hash') == content_hash and meta.get('model_version') == version:
+            embedding_store.update_meta(image_key(image_id), signature=signature)
+            hashes[image_id] = content_hash
+            skipped += 1
+            continue
+        pending.append((image_id, content_hash, signature, decode_pool.submit(store_thumbnail, image_id, data)))
+
+    stored, failed = 0, []
+    for start in range(0, len(pending), BATCH_SIZE):
+        batch = [(image_id, content_hash, signature, future.result())
+                 for image_id, content_hash, signature, future in pending[start:start + BATCH_SIZE]]
+        failed.extend(image_id for image_id, _, _, tensor in batch if tensor is None)
+        batch = [item for item in batch if item[3] is not None]
+        if not batch:
+            continue
+        with torch.inference_mode():
+            batch_features = model(torch.stack([tensor for _, _, _, tensor in batch])).flatten(1).numpy()
+        for (image_id, content_hash, signature, _), vec in zip(batch, batch_features):
+            embedding_store.put(image_key(image_id), vec,
+                                {'hash': content_hash, 'signature': signature, 'model_version': version})
+            hashes[image_id] = content_hash
+            stored += 1
+    log(f"📥 Ingested {stored} image(s) ({skipped} unchanged, {len(failed)} failed)")
+    return stored, skipped, failed, hashes
+
+# Embeddings of ingested images; entries from an older model are recomputed
+# from their thumbnails
+def embed_image_ids(image_ids, model):
+    version = _model_state["version"]
+    features, stale = {}, {}
+    for image_id in dict.fromkeys(image_ids):
+        meta = embedding_store.meta(image_key(image_id))
+        if meta is None:
+            log(f"❌ Image was never ingested: {image_id}")
+        elif meta.get('model_version') == version:
+            features[image_id] = embedding_store.get(image_key(image_id))
+        elif os.path.isfile(thumbnail_path(image_id)):
+            stale[thumbnail_path(image_id)] = (image_id, meta)
+
+    for paths, tensors, _ in decoded_batches(list(stale)):
+        if not tensors:
+            continue
+        with torch.inference_mode():
+            batch_features = model(torch.stack(tensors)).flatten(1).numpy()
+        for path, vec in zip(paths, batch_features):
+            image_id, meta = stale[path]
+            embedding_store.put(image_key(image_id), vec, dict(meta, model_version=version))
+            features[image_id] = vec
+    if stale:
+        log(f"♻️ Re-embedded {len(stale)} ingested image(s) for {version}")
+    return features
+
+# Reports refer to their images either by ingested id or by share path
+def report_images(report):
+    return report['image_ids'] if 'image_ids' in report else report.get('image_paths', [])
+
+def embed_report_images(reports, model):
+    image_ids = [i for report in reports if 'image_ids' in report for i in report['image_ids']]
+    image_paths = [p for report in reports if 'image_ids' not in report for p in report.get('image_paths', [])]
+    features = embed_images(image_paths, model) if image_paths else {}
+    if image_ids:
+        features.update(embed_image_ids(image_ids, model))
+    return features
+
+# Stack every image vector of the given reports into one L2-normalized matrix,
+# remembering which report each row belongs to
+def gather_vectors(reports, model):
+    features = embed_report_images(reports, model)
+    vectors, owners, paths = [], [], []
+    for i, report in enumerate(reports):
+        for image_path in report_images(report):
+            vec = features.get(image_path)
+            if vec is not None:
+                vectors.append(vec)
+                owners.append(i)
+                paths.append(image_path)
+    if not vectors:
+        return np.zeros((0, FEATURE_DIM), dtype=np.float32), np.zeros(0, dtype=np.int64), paths
+    matrix = np.vstack(vectors).astype(np.float32)
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    return matrix, np.array(owners, dtype=np.int64), paths
+
+# Pick the highest-scoring image pair above threshold for each (lost, found) report pair
+def best_report_pairs(similarity, lost_owners, found_owners, n_found, threshold):
+    rows, cols = np.nonzero(similarity >= threshold)
+    if rows.size == 0:
+        return rows, cols, np.zeros(0, dtype=np.float32)
+    scores = similarity[rows, cols]
+    pair_keys = lost_owners[rows] * n_found + found_owners[cols]
+    order = np.lexsort((-scores, pair_keys))
+    sorted_keys = pair_keys[order]
+    first = np.ones(order.size, dtype=bool)
+    first[1:] = sorted_keys[1:] != sorted_keys[:-1]
+    best = order[first]
+    return rows[best], cols[best], scores[best]
 
 # Matching logic
 def match_images(lost_reports, found_reports, model, threshold=0.85):
     log("🚀 Starting image matching process...")
+    lost_matrix, lost_owners, lost_paths = gather_vectors(lost_reports, model)
+    found_matrix, found_owners, found_paths = gather_vectors(found_reports, model)
+    log(f"📷 Scoring {len(lost_paths)} lost image(s) against {len(found_paths)} found image(s)")
+
+    similarity = lost_matrix @ found_matrix.T
+    rows, cols, scores = best_report_pairs(similarity, lost_owners, found_owners, len(found_reports), -np.inf)
+
+    # Best image score of every report pair that has images on both sides
+    pair_scores = np.full((len(lost_reports), len(found_reports)), np.nan)
+    pair_scores[lost_owners[rows], found_owners[cols]] = scores
+
     matches = []
-    for lost in lost_reports:
-        lost_imgs = lost.get('image_paths', [])
-        for found in found_reports:
-            found_imgs = found.get('image_paths', [])
-            for lost_img in lost_imgs:
-                for found_img in found_imgs:
-                    log(f"📷 Comparing Lost[{lost['_id']}] with Found[{found['_id']}]")
-                    lost_vec = extract_features(lost_img, model)
-                    found_vec = extract_features(found_img, model)
-                    score = cosine_similarity(lost_vec, found_vec)
-                    log(f"📏 Similarity score: {score:.2f}")
-                    if score >= threshold:
-                        match_entry = {
-                            'lost_id': str(lost['_id']),
-                            'found_id': str(found['_id']),
-                            'score': round(float(score), 4),
-                            'matched_on': datetime.now().isoformat()
-                        }
-                        matches.append(match_entry)
-                        log(f"✅ Image match found: {match_entry}")
+    for row, col, score in zip(rows, cols, scores):
+        if score < threshold:
+            continue
+        match_entry = {
+            'lost_id': str(lost_reports[lost_owners[row]]['_id']),
+            'found_id': str(found_reports[found_owners[col]]['_id']),
+            'score': round(float(score), 4),
+            'lost_image': lost_paths[row],
+            'found_image': found_paths[col],
+            'matched_on': datetime.now().isoformat()
+        }
+        matches.append(match_entry)
+        log(f"✅ Image match found: {match_entry}")
     log("✅ Image matching completed.")
-    return matches
+    lost_ids = [str(r['_id']) for r in lost_reports]
+    found_ids = [str(r['_id']) for r in found_reports]
+    return matches, (lost_ids, found_ids, pair_scores)
+
+# ------------------------
+# Lost Report Index
+# ------------------------
+
+# Each indexed image is stored under "<report_id>|<image>"; a lost report
+# owns the keys of its images (possibly none), is tagged with the
+# coordinator's hash of its image names so changed images get re-indexed,
+# and is stored with its blocking keys. The index is tagged with the model
+# version the vectors came from.
+lost_index = ReportIndex(INDEX_DIR, FEATURE_DIM, INDEX_BACKEND, model_version())
+if lost_index.discarded:
+    log("♻️ Image index was built with another model version; rebuilding")
+
+def reset_index():
+    lost_index.reset(model_version())
+
+def index_reports(reports, tags):
+    features = embed_report_images(reports, get_model())
+    entries = []
+    for report in reports:
+        report_id = str(report['_id'])
+        images = [image for image in dict.fromkeys(report_images(report)) if image in features]
+        keys = [f"{report_id}|{image}" for image in images]
+        entries.append((report_id, tags.get(report_id), keys, [features[image] for image in images], blocking_keys(report)))
+    added = lost_index.add(entries)
+    embedding_store.flush()
+    log(f"🗂️ Indexed {added} image(s) from {len(reports)} lost report(s)")
+    return added
+
+# Query the index with every image of each found report and keep the top-k
+# lost reports by their best image score; with blocking settings only lost
+# reports the blocking rules keep are returned
+def query_index(found_reports, model, top_k=DEFAULT_TOP_K, threshold=0.85, blocking=None):
+    found_matrix, found_owners, found_paths = gather_vectors(found_reports, model)
+    if len(found_paths) == 0:
+        return [], score_matrix.from_pairs([], found_ids=[str(r['_id']) for r in found_reports])
+    allowed = None
+    if blocking is not None:
+        filters = [index_filter(lost_index, found, blocking) for found in found_reports]
+        allowed = [filters[owner] for owner in found_owners]
+    keys, scores = lost_index.search(found_matrix, top_k, allowed)
+
+    best = {}
+    for row, (row_keys, row_scores) in enumerate(zip(keys, scores)):
+        for key, score in zip(row_keys, row_scores):
+            pair = (found_owners[row], key.split('|', 1)[0])
+            if pair not in best or score > best[pair][0]:
+                best[pair] = (float(score), key.split('|', 1)[1], found_paths[row])
+
+    matches = []
+    for (found_idx, lost_id), (score, lost_image, found_image) in best.items():
+        if score < threshold:
+            continue
+        match_entry = {
+            'lost_id': lost_id,
+            'found_id': str(found_reports[found_idx]['_id']),
+            'score': round(score, 4),
+            'lost_image': lost_image,
+            'found_image': found_image,
+            'matched_on': datetime.now().isoformat()
+        }
+        matches.append(match_entry)
+        log(f"✅ Image match found: {match_entry}")
+    table = score_matrix.from_pairs(
+        [(lost_id, str(found_reports[found_idx]['_id']), score) for (found_idx, lost_id), (score, _, _) in best.items()],
+        found_ids=[str(r['_id']) for r in found_reports])
+    return matches, table
 
 # API endpoint
 @app.route('/match-image', methods=['POST'])
 def match_image():
     data = request.get_json()
-    lost = data.get('lost', [])
     found = data.get('found', [])
-    model = get_feature_extractor()
-    matches = match_images(lost, found, model)
-    return jsonify({'matches': matches}), 200
+    model = get_model()
+    if 'lost' in data:
+        matches, table = match_images(data.get('lost', []), found, model)
+    else:
+        # No lost list: search the lost-report index instead of a full cross product
+        matches, table = query_index(found, model, int(data.get('top_k', DEFAULT_TOP_K)),
+                                     blocking=data.get('blocking'))
+    embedding_store.flush()
+    response = {'matches': matches, 'model_version': model_version()}
+    if data.get('include_scores'):
+        # Raw scores of every evaluated pair, including those below threshold
+        response['scores'] = score_matrix.encode(*table)
+    return jsonify(response), 200
+
+register_index_routes(app, lost_index, index_reports)
+
+# Multipart upload: one "ids" and one "signatures" form value per "images"
+# file, in the same order
+@app.route('/images/ingest', methods=['POST'])
+def ingest():
+    image_ids = request.form.getlist('ids')
+    signatures = request.form.getlist('signatures') or [None] * len(image_ids)
+    files = request.files.getlist('images')
+    if not len(image_ids) == len(signatures) == len(files):
+        return jsonify({'error': 'ids, signatures and images must have the same length'}), 400
+    items = [(i, f.read(), signature) for i, f, signature in zip(image_ids, files, signatures)]
+    stored, skipped, failed, hashes = ingest_images(items, get_model())
+    embedding_store.flush()
+    return jsonify({'stored': stored, 'skipped': skipped, 'failed': failed, 'hashes': hashes}), 200
+
+# Which of the given image ids have to be uploaded (again): never ingested,
+# ingested from a file with another signature, or from an older model with
+# no thumbnail left to re-embed. The content hashes of the others are returned.
+@app.route('/images/missing', methods=['POST'])
+def missing_images():
+    data = request.get_json()
+    signatures = data.get('signatures', {})
+    version = model_version()
+    missing, hashes = [], {}
+    for image_id in (str(i) for i in data.get('ids', [])):
+        meta = embedding_store.meta(image_key(image_id))
+        if (meta is None
+                or (image_id in signatures and meta.get('signature') != signatures[image_id])
+                or (meta.get('model_version') != version and not os.path.isfile(thumbnail_path(image_id)))):
+            missing.append(image_id)
+        else:
+            hashes[image_id] = meta.get('hash')
+    return jsonify({'missing': missing, 'hashes': hashes}), 200
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    status = {k: v for k, v in _model_state.items() if k != "model"}
+    status['ready'] = _model_state["model"] is not None
+    return jsonify(status), 200 if status['ready'] else 503
+
+@app.route('/warmup', methods=['POST'])
+def warmup():
+    elapsed = warm_up()
+    return jsonify({'warm': True, 'seconds': round(elapsed, 3)}), 200
+
+@app.route('/reload', methods=['POST'])
+def reload_model():
+    force = bool((request.get_json(silent=True) or {}).get('force', False))
+    reloaded = reload_if_changed(force=force)
+    return jsonify({'reloaded': reloaded, 'version': _model_state["version"]}), 200
 
 # Run agent
 if __name__ == '__main__':
+    if OFFLINE:
+        log("📴 Offline mode: model weights are loaded from local caches only")
+    if PRELOAD_MODEL:
+        load_model()
+        warm_up()
     log("🔁 Image Matching Agent is listening on port 5002...")
     app.run(port=5002)
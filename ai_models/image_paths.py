@@ -0,0 +1,105 @@
+import threading
+import time
+import os
+
+# Resolves the image names stored on reports ("/uploads/Lost/<file>" or the
+# nested "/uploads/Lost/<reportId>/<file>", or a bare file name) to paths
+# under the uploads share. Directory listings are cached and only re-read
+# when the directory's mtime changes, checked at most every ttl seconds, so
+# a cycle costs at most one stat per directory instead of a listing per
+# report and a stat per image. Listings come from os.scandir and keep each
+# file's mtime/size signature (returned with the listing on Windows shares);
+# uploads that add or replace a file change the directory mtime, so the
+# signatures are refreshed with the listing.
+
+LISTING_TTL = float(os.environ.get("IMAGE_LISTING_TTL", "30"))
+
+
+def scan_signatures(directory):
+    signatures = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            try:
+                stat = entry.stat()
+                signatures[entry.name] = f"{stat.st_mtime_ns}:{stat.st_size}"
+            except OSError:
+                signatures[entry.name] = None
+    return signatures
+
+
+class DirectoryListing:
+    def __init__(self, mtime, signatures):
+        self.mtime = mtime
+        self.checked_at = time.monotonic()
+        self.signatures = signatures
+        names = list(signatures)
+        self.by_name = {name.lower(): name for name in names}
+        self.by_stem = {}
+        for name in names:
+            self.by_stem.setdefault(os.path.splitext(name)[0].lower(), name)
+
+    def find(self, filename):
+        name = filename.lower()
+        return self.by_name.get(name) or self.by_stem.get(os.path.splitext(name)[0])
+
+
+class ImagePathResolver:
+    def __init__(self, base_path, ttl=LISTING_TTL):
+        self.base_path = base_path
+        self.ttl = ttl
+        self.listings = {}
+        self.lock = threading.Lock()
+
+    def _listing(self, directory, force=False):
+        directory = os.path.normpath(directory)
+        with self.lock:
+            cached = self.listings.get(directory)
+        if cached and not force and time.monotonic() - cached.checked_at < self.ttl:
+            return cached
+        try:
+            mtime = os.stat(directory).st_mtime
+            if cached and cached.mtime == mtime:
+                cached.checked_at = time.monotonic()
+                return cached
+            listing = DirectoryListing(mtime, scan_signatures(directory))
+        except OSError:
+            listing = DirectoryListing(None, {})
+        with self.lock:
+            self.listings[directory] = listing
+        return listing
+
+    # A miss re-checks the directory mtime, so files uploaded since the last
+    # listing are picked up without waiting for the ttl
+    def _find(self, directory, filename):
+        match = self._listing(directory).find(filename)
+        if match is None:
+            match = self._listing(directory, force=True).find(filename)
+        return os.path.normpath(os.path.join(directory, match)) if match else None
+
+    # Signature of a resolved path from its directory's cached listing
+    def signature(self, path):
+        return self._listing(os.path.dirname(path)).signatures.get(os.path.basename(path))
+
+    def _inside_base(self, path):
+        base = os.path.abspath(self.base_path)
+        try:
+            return os.path.commonpath([base, os.path.abspath(path)]) == base
+        except ValueError:  # different drives
+            return False
+
+    # Stored names look like "/uploads/<Type>/[<reportId>/]<file>"; the file is
+    # looked up in its own directory first, then by name in the type folder.
+    # Names are user-editable, so "." / ".." and drive components are rejected
+    # and the result has to stay under the share.
+    def resolve(self, stored_name, report_type):
+        parts = [p for p in stored_name.replace("\\", "/").split("/") if p]
+        if parts and parts[0].lower() == "uploads":
+            parts = parts[1:]
+        if not parts or any(p in (".", "..") or ":" in p for p in parts):
+            return None
+        type_folder = os.path.join(self.base_path, report_type.capitalize())
+        path = None
+        if len(parts) > 1:
+            path = self._find(os.path.join(self.base_path, *parts[:-1]), parts[-1])
+        path = path or self._find(type_folder, parts[-1])
+        return path if path and self._inside_base(path) else None
@@ -0,0 +1,35 @@
+from flask import request, jsonify
+
+# /index/* endpoints shared by the matching agents. The coordinator keeps an
+# agent's ReportIndex in line with the active lost reports: /index/sync drops
+# reports that are no longer active and returns the ones to (re-)add, which
+# are then sent to /index/add with the same hashes. index_reports(reports,
+# tags) embeds and adds them under those tags and returns the number of
+# vectors added.
+
+
+def register_index_routes(app, report_index, index_reports):
+    def sync_index():
+        data = request.get_json()
+        tags = data.get('hashes', {})
+        missing, stale = report_index.sync({str(i): tags.get(str(i)) for i in data.get('ids', [])})
+        return jsonify({'missing': missing, 'removed_reports': len(stale)}), 200
+
+    def add_to_index():
+        data = request.get_json()
+        added = index_reports(data.get('reports', []), data.get('hashes', {}))
+        report_index.save()
+        return jsonify({'indexed_vectors': added, 'size': len(report_index)}), 200
+
+    def remove_from_index():
+        removed = report_index.remove([str(i) for i in request.get_json().get('ids', [])])
+        report_index.save()
+        return jsonify({'removed_vectors': removed, 'size': len(report_index)}), 200
+
+    def index_stats():
+        return jsonify(report_index.stats()), 200
+
+    app.add_url_rule('/index/sync', 'sync_index', sync_index, methods=['POST'])
+    app.add_url_rule('/index/add', 'add_to_index', add_to_index, methods=['POST'])
+    app.add_url_rule('/index/remove', 'remove_from_index', remove_from_index, methods=['POST'])
+    app.add_url_rule('/index/stats', 'index_stats', index_stats, methods=['GET'])
@@ -0,0 +1,148 @@
+from datetime import datetime
+import numpy as np
+import os
+
+# Weighted fusion of the agents' raw scores with cheap structured signals.
+# Every signal is an L×F matrix in [0, 1], NaN where it cannot be computed
+# for a pair (no images, no color, no coordinates, ...). The fused score is
+# the weighted mean of the signals available for each pair, so a missing
+# signal neither helps nor hurts. A pair can only match when at least one ML
+# score also clears that agent's own floor: structured agreement adjusts the
+# fused score but cannot carry a weak text or image score over the threshold.
+
+DEFAULT_WEIGHTS = {
+    "text": 0.45,
+    "image": 0.30,
+    "category": 0.10,
+    "color": 0.05,
+    "distance": 0.05,
+    "date": 0.05
+}
+FUSED_THRESHOLD = float(os.environ.get("FUSED_THRESHOLD", "0.65"))
+ML_FLOORS = {
+    "text": float(os.environ.get("FUSION_TEXT_FLOOR", "0.6")),
+    "image": float(os.environ.get("FUSION_IMAGE_FLOOR", "0.85"))
+}
+DISTANCE_SCALE_KM = float(os.environ.get("FUSION_DISTANCE_SCALE_KM", "5"))
+DATE_SCALE_DAYS = float(os.environ.get("FUSION_DATE_SCALE_DAYS", "14"))
+EARTH_RADIUS_KM = 6371.0
+
+
+# FUSION_WEIGHTS="text=0.5,image=0.3" overrides individual weights
+def load_weights():
+    weights = dict(DEFAULT_WEIGHTS)
+    for item in filter(None, os.environ.get("FUSION_WEIGHTS", "").split(",")):
+        name, value = item.split("=")
+        weights[name.strip()] = float(value)
+    return weights
+
+WEIGHTS = load_weights()
+
+
+def field(reports, section, name):
+    return np.array([str((r.get(section) or {}).get(name) or "").strip().lower() for r in reports], dtype=object)
+
+
+# 1 where both sides have the same non-empty value, 0 where they differ
+def equality(lost_values, found_values):
+    same = (lost_values[:, None] == found_values[None, :]).astype(np.float64)
+    same[(lost_values == "")[:, None] | (found_values == "")[None, :]] = np.nan
+    return same
+
+
+# Share of the category / subCategory / itemType fields that agree
+def category_signal(lost_reports, found_reports):
+    checks = np.stack([
+        equality(field(lost_reports, "itemDetails", name), field(found_reports, "itemDetails", name))
+        for name in ("category", "subCategory", "itemType")
+    ])
+    known = (~np.isnan(checks)).sum(axis=0)
+    agreed = np.nansum(checks, axis=0)
+    return np.where(known > 0, agreed / np.maximum(known, 1), np.nan)
+
+
+# 1 for the same primary color, 0.5 when a primary matches the other side's secondary
+def color_signal(lost_reports, found_reports):
+    lost_primary = field(lost_reports, "itemDetails", "primaryColor")
+    lost_secondary = field(lost_reports, "itemDetails", "secondaryColor")
+    found_primary = field(found_reports, "itemDetails", "primaryColor")
+    found_secondary = field(found_reports, "itemDetails", "secondaryColor")
+    primary = equality(lost_primary, found_primary)
+    crossed = np.fmax(equality(lost_primary, found_secondary), equality(lost_secondary, found_primary))
+    return np.where(primary == 1, 1.0, np.where(crossed == 1, 0.5, primary))
+
+
+# (lat, lng) in radians; the backend stores 0, 0 when no location was given
+def coordinates(reports):
+    points = np.full((len(reports), 2), np.nan)
+    for i, report in enumerate(reports):
+        location = (report.get("locationDetails") or {}).get("lastSeenLocation") or {}
+        lat, lng = location.get("lat"), location.get("lng")
+        if isinstance(lat, (int, float)) and isinstance(lng, (int, float)) and (lat, lng) != (0, 0):
+            points[i] = lat, lng
+    return np.radians(points)
+
+
+def haversine_km(lost_points, found_points):
+    lat1, lng1 = lost_points[:, 0:1], lost_points[:, 1:2]
+    lat2, lng2 = found_points[:, 0][None, :], found_points[:, 1][None, :]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def distance_signal(lost_reports, found_reports):
+    return np.exp(-haversine_km(coordinates(lost_reports), coordinates(found_reports)) / DISTANCE_SCALE_KM)
+
+
+# Days since the epoch of each report's lostDate (datetime or ISO string)
+def report_days(reports):
+    days = np.full(len(reports), np.nan)
+    for i, report in enumerate(reports):
+        value = (report.get("locationDetails") or {}).get("lostDate")
+        if isinstance(value, str):
+            try:
+                value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+            except ValueError:
+                continue
+        if isinstance(value, datetime):
+            days[i] = value.timestamp() / 86400
+    return days
+
+
+# Decays with the gap between losing and finding; an item found more than a
+# day before it was lost cannot be the same item
+def date_signal(lost_reports, found_reports):
+    gap = report_days(found_reports)[None, :] - report_days(lost_reports)[:, None]
+    signal = np.exp(-np.abs(gap) / DATE_SCALE_DAYS)
+    signal[gap < -1] = 0.0
+    return signal
+
+
+def structured_signals(lost_reports, found_reports):
+    return {
+        "category": category_signal(lost_reports, found_reports),
+        "color": color_signal(lost_reports, found_reports),
+        "distance": distance_signal(lost_reports, found_reports),
+        "date": date_signal(lost_reports, found_reports)
+    }
+
+
+# Pairs where at least one of the given ML signals reaches its floor
+def ml_confident(signals, floors=ML_FLOORS):
+    confident = None
+    for name, scores in signals.items():
+        with np.errstate(invalid="ignore"):
+            passed = scores >= floors.get(name, np.inf)
+        confident = passed if confident is None else confident | passed
+    return confident
+
+
+def fuse(signals, weights=WEIGHTS):
+    total = weighted = None
+    for name, signal in signals.items():
+        weight = weights.get(name, 0.0)
+        available = ~np.isnan(signal)
+        contribution = np.where(available, signal * weight, 0.0)
+        total = contribution if total is None else total + contribution
+        weighted = available * weight if weighted is None else weighted + available * weight
+    return np.where(weighted > 0, total / np.maximum(weighted, 1e-12), np.nan)
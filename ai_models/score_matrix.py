@@ -0,0 +1,66 @@
+import numpy as np
+
+# Raw (lost, found) score matrices exchanged between the matching agents and
+# the coordinator. A table is (lost_ids, found_ids, matrix) with lost reports
+# as rows, found reports as columns and NaN for pairs that were not scored.
+# On the wire it is {"lost_ids": [...], "found_ids": [...], "values": [[...]]}
+# with null in place of NaN.
+
+
+def encode(lost_ids, found_ids, matrix, decimals=4):
+    matrix = np.asarray(matrix, dtype=np.float64).reshape(len(lost_ids), len(found_ids))
+    values = np.round(matrix, decimals).astype(object)
+    values[np.isnan(matrix)] = None
+    return {"lost_ids": list(lost_ids), "found_ids": list(found_ids), "values": values.tolist()}
+
+
+def decode(payload):
+    lost_ids, found_ids = payload["lost_ids"], payload["found_ids"]
+    matrix = np.array(payload["values"], dtype=np.float64).reshape(len(lost_ids), len(found_ids))
+    return lost_ids, found_ids, matrix
+
+
+# Build a table from (lost_id, found_id, score) triples; the axes default to
+# the ids seen in the triples
+def from_pairs(pairs, lost_ids=None, found_ids=None):
+    pairs = list(pairs)
+    lost_ids = list(dict.fromkeys(lost_ids if lost_ids is not None else (p[0] for p in pairs)))
+    found_ids = list(dict.fromkeys(found_ids if found_ids is not None else (p[1] for p in pairs)))
+    lost_pos = {i: n for n, i in enumerate(lost_ids)}
+    found_pos = {i: n for n, i in enumerate(found_ids)}
+    matrix = np.full((len(lost_ids), len(found_ids)), np.nan)
+    if pairs:
+        rows = np.array([lost_pos[p[0]] for p in pairs])
+        cols = np.array([found_pos[p[1]] for p in pairs])
+        matrix[rows, cols] = [p[2] if p[2] is not None else np.nan for p in pairs]
+    return lost_ids, found_ids, matrix
+
+
+# The part of a table that falls on the given axes; everything else is NaN
+def align(table, lost_ids, found_ids):
+    table_lost, table_found, matrix = table
+    lost_pos = {i: n for n, i in enumerate(lost_ids)}
+    found_pos = {i: n for n, i in enumerate(found_ids)}
+    rows = np.array([lost_pos.get(i, -1) for i in table_lost], dtype=np.int64)
+    cols = np.array([found_pos.get(i, -1) for i in table_found], dtype=np.int64)
+    aligned = np.full((len(lost_ids), len(found_ids)), np.nan)
+    keep_rows, keep_cols = rows >= 0, cols >= 0
+    aligned[np.ix_(rows[keep_rows], cols[keep_cols])] = matrix[np.ix_(keep_rows, keep_cols)]
+    return aligned
+
+
+# Union of several tables; later tables win where they have a score
+def combine(*tables):
+    lost_ids = list(dict.fromkeys(i for table in tables for i in table[0]))
+    found_ids = list(dict.fromkeys(i for table in tables for i in table[1]))
+    matrix = np.full((len(lost_ids), len(found_ids)), np.nan)
+    for table in tables:
+        aligned = align(table, lost_ids, found_ids)
+        matrix = np.where(np.isnan(aligned), matrix, aligned)
+    return lost_ids, found_ids, matrix
+
+
+def scored_pairs(table):
+    lost_ids, found_ids, matrix = table
+    rows, cols = np.nonzero(~np.isnan(matrix))
+    return [(lost_ids[r], found_ids[c], float(matrix[r, c])) for r, c in zip(rows, cols)]
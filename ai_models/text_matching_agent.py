@@ -1,25 +1,45 @@
 from flask import Flask, request, jsonify
-import nltk
 import numpy as np
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
-from langdetect import detect
 from datetime import datetime
 import traceback
-from sentence_transformers import SentenceTransformer, util
-
-nltk.download('punkt')
-nltk.download('stopwords')
+import threading
+import hashlib
+import os
+from agent_resources import StartupTimer, ensure_nltk_data, model_path
+from embedding_store import EmbeddingStore, LRUCache
+import text_preprocessing
+import score_matrix
+from vector_index import ReportIndex
+from index_routes import register_index_routes
+from blocking import blocking_keys, index_filter
 
 app = Flask(__name__)
 
-STOPWORDS = {
-    'en': set(stopwords.words('english')),
-    'ar': set(stopwords.words('arabic'))
-}
+NLTK_RESOURCES = [('stopwords', 'corpora/stopwords')]
+
+# SBERT model, loaded on first use or by the background warm-up
+MODEL_NAME = 'all-MiniLM-L6-v2'  # Lightweight and fast
+EMBEDDING_DIM = 384
+WARMUP_ON_START = os.environ.get("TEXT_WARMUP_ON_START", "1") == "1"
+model = None
+
+EMBEDDING_VERSION = f"{MODEL_NAME}/normalized/{text_preprocessing.PREPROCESS_VERSION}"
+ENCODE_BATCH_SIZE = int(os.environ.get("TEXT_ENCODE_BATCH_SIZE", "64"))
 
-# Load SBERT model
-model = SentenceTransformer('all-MiniLM-L6-v2')  # Lightweight and fast
+# Embedding cache settings
+TEXT_CACHE_DIR = os.environ.get(
+    "TEXT_EMBEDDING_CACHE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "text_embeddings")
+)
+TEXT_CACHE_SIZE = int(os.environ.get("TEXT_CACHE_SIZE", "10000"))
+
+# Semantic index of active lost reports ("flat" is exact, "hnsw" needs hnswlib)
+INDEX_BACKEND = os.environ.get("TEXT_INDEX_BACKEND", "flat")
+INDEX_DIR = os.environ.get(
+    "TEXT_INDEX_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "text_index")
+)
+DEFAULT_TOP_K = int(os.environ.get("TEXT_INDEX_TOP_K", "20"))
 
 def log(message, status="INFO"):
     symbols = {
@@ -32,64 +52,214 @@ def log(message, status="INFO"):
     }
     print(f"{symbols.get(status, 'ℹ️')} [Text Matching Agent] {message}")
 
-def detect_language(text):
+# ------------------------
+# Startup
+# ------------------------
+
+# Nothing is downloaded or loaded at import time; resources are checked and
+# models loaded on first use, or up front by startup() on a background thread.
+startup_timer = StartupTimer()
+_resource_lock = threading.Lock()
+_model_lock = threading.Lock()
+_ready = threading.Event()
+
+def load_stopwords():
+    from nltk.corpus import stopwords
+    text_preprocessing.set_stopwords({
+        'en': set(stopwords.words('english')),
+        'ar': set(stopwords.words('arabic'))
+    })
+
+def ensure_text_resources():
+    if text_preprocessing.STOPWORDS:
+        return
+    with _resource_lock:
+        if not text_preprocessing.STOPWORDS:
+            startup_timer.run('nltk_data', ensure_nltk_data, NLTK_RESOURCES)
+            startup_timer.run('stopwords', load_stopwords)
+
+def load_model():
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_path(MODEL_NAME))
+
+def get_model():
+    global model
+    if model is None:
+        with _model_lock:
+            if model is None:
+                model = startup_timer.run('model_load', load_model)
+    return model
+
+def startup():
     try:
-        return detect(text)
-    except:
-        return 'en'
+        ensure_text_resources()
+        startup_timer.run('warmup', get_model().encode, ['warm up'], normalize_embeddings=True)
+        _ready.set()
+        log(f"🚀 Startup complete: {startup_timer.report()['timings']}", "SUCCESS")
+    except Exception as e:
+        log(f"❌ Startup failed: {e}", "ERROR")
+        traceback.print_exc()
+
+def start_background_warmup():
+    threading.Thread(target=startup, daemon=True, name="text-agent-warmup").start()
 
+# Script-based language detection + regex tokenizer, memoized per text
 def preprocess(text):
-    lang = detect_language(text)
-    tokens = word_tokenize(text.lower())
-    tokens = [word for word in tokens if word.isalnum()]
-    stop_words = STOPWORDS.get(lang, set())
-    filtered_tokens = [word for word in tokens if word not in stop_words]
-    return ' '.join(filtered_tokens)
-
-def compute_similarity(text1, text2):
-    embeddings = model.encode([text1, text2], convert_to_tensor=True)
-    similarity = util.pytorch_cos_sim(embeddings[0], embeddings[1]).item()
-    return similarity
-
-def match_reports(lost_reports, found_reports, threshold=0.6):
+    ensure_text_resources()
+    return text_preprocessing.preprocess(text)
+
+# ------------------------
+# Embedding Cache
+# ------------------------
+
+# Each report is preprocessed and encoded once per (report id, text hash):
+# hot entries live in a bounded LRU, everything else in the on-disk store.
+embedding_store = EmbeddingStore(TEXT_CACHE_DIR, EMBEDDING_DIM)
+memory_cache = LRUCache(TEXT_CACHE_SIZE)
+cache_stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+_stats_lock = threading.Lock()
+
+def count(stat):
+    with _stats_lock:
+        cache_stats[stat] += 1
+
+def report_text(report):
+    details = report.get('itemDetails', {})
+    return details.get('title', '') + ' ' + details.get('description', '')
+
+def text_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+def report_key(report, digest):
+    return str(report.get('_id') or f"text:{digest}")
+
+# Resolve embeddings for many reports: cache hits come from the LRU or disk,
+# all misses are preprocessed and encoded together in batched calls
+def report_embeddings(reports):
+    resolved, misses, keys_in_order = {}, {}, []
+    for report in reports:
+        raw_text = report_text(report)
+        digest = text_hash(raw_text)
+        key = report_key(report, digest)
+        keys_in_order.append(key)
+        if key in resolved or key in misses:
+            continue
+
+        cached = memory_cache.get(key)
+        if cached is not None and cached[0] == digest:
+            count("memory_hits")
+            resolved[key] = cached
+            continue
+
+        meta = embedding_store.meta(key)
+        if meta is not None and meta.get('hash') == digest and meta.get('model') == EMBEDDING_VERSION:
+            count("disk_hits")
+            resolved[key] = (digest, meta['text'], embedding_store.get(key))
+            memory_cache.put(key, resolved[key])
+        else:
+            count("misses")
+            misses[key] = (digest, preprocess(raw_text))
+
+    if misses:
+        keys = list(misses)
+        vectors = get_model().encode(
+            [misses[k][1] for k in keys],
+            batch_size=ENCODE_BATCH_SIZE,
+            normalize_embeddings=True,
+            convert_to_numpy=True
+        )
+        for key, vector in zip(keys, vectors):
+            digest, text = misses[key]
+            embedding_store.put(key, vector, {'hash': digest, 'text': text, 'model': EMBEDDING_VERSION})
+            resolved[key] = (digest, text, vector)
+            memory_cache.put(key, resolved[key])
+        log(f"🧮 Encoded {len(keys)} report(s) in batches of {ENCODE_BATCH_SIZE}", "STEP")
+
+    return [resolved[key] for key in keys_in_order]
+
+def embedding_matrix(reports):
+    entries = report_embeddings(reports)
+    if not entries:
+        return np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+    return np.vstack([vector for _, _, vector in entries]).astype(np.float32)
+
+# Full L×F cosine matrix (embeddings are normalized, so a single matmul)
+def similarity_matrix(lost_reports, found_reports):
+    return embedding_matrix(lost_reports) @ embedding_matrix(found_reports).T
+
+def match_reports(lost_reports, found_reports, threshold=0.6, top_k=None):
     log("🚀 Starting text matching process...", "STEP")
+    scores = similarity_matrix(lost_reports, found_reports)
+    log(f"📏 Scored {scores.shape[0]} lost × {scores.shape[1]} found report pair matrix", "COMPARE")
+
     matches = []
-    for lost in lost_reports:
-        try:
-            lost_id = lost.get('_id')
-            lost_text_raw = lost['itemDetails'].get('title', '') + ' ' + lost['itemDetails'].get('description', '')
-            lost_text = preprocess(lost_text_raw)
-
-            log(f"📥 Processing Lost Report [{lost_id}]")
-            log(f"🔍 Preprocessed Lost Text: {lost_text}", "INFO")
-
-            for found in found_reports:
-                found_id = found.get('_id')
-                found_text_raw = found['itemDetails'].get('title', '') + ' ' + found['itemDetails'].get('description', '')
-                found_text = preprocess(found_text_raw)
-
-                log(f"📥 Comparing with Found Report [{found_id}]", "INFO")
-                log(f"🔍 Preprocessed Found Text: {found_text}", "INFO")
-
-                score = compute_similarity(lost_text, found_text)
-                log(f"📏 Similarity Score (Lost[{lost_id}] vs Found[{found_id}]): {score:.2f}", "COMPARE")
-
-                if score >= threshold:
-                    match_entry = {
-                        'lost_id': str(lost_id),
-                        'found_id': str(found_id),
-                        'score': round(score, 3),
-                        'matched_on': datetime.now().isoformat()
-                    }
-                    matches.append(match_entry)
-                    log(f"✅ Match Found: {match_entry}", "SUCCESS")
-
-        except Exception as e:
-            log(f"❌ Error comparing Lost[{lost.get('_id')}] with found reports: {e}", "ERROR")
-            traceback.print_exc()
+    for row, col in zip(*np.nonzero(scores >= threshold)):
+        match_entry = {
+            'lost_id': str(lost_reports[row].get('_id')),
+            'found_id': str(found_reports[col].get('_id')),
+            'score': round(float(scores[row, col]), 3),
+            'matched_on': datetime.now().isoformat()
+        }
+        matches.append(match_entry)
+        log(f"✅ Match Found: {match_entry}", "SUCCESS")
+
+    top = None
+    if top_k:
+        k = min(int(top_k), scores.shape[0])
+        order = np.argsort(-scores, axis=0)[:k]
+        top = {
+            str(found.get('_id')): [
+                {'lost_id': str(lost_reports[row].get('_id')), 'score': round(float(scores[row, col]), 3)}
+                for row in order[:, col]
+            ]
+            for col, found in enumerate(found_reports)
+        }
 
     log("✅ Text matching completed.", "SUCCESS")
-    return matches
+    return matches, top, scores
+
+# ------------------------
+# Lost Report Index
+# ------------------------
+
+# One vector per lost report keyed by report id, tagged with the hash the
+# coordinator indexed it with so edited reports get re-indexed, and stored
+# with the report's blocking keys.
+lost_index = ReportIndex(INDEX_DIR, EMBEDDING_DIM, INDEX_BACKEND, EMBEDDING_VERSION)
+if lost_index.discarded:
+    log("♻️ Text index was built with another model; rebuilding", "STEP")
+
+def index_reports(reports, tags):
+    entries = report_embeddings(reports)
+    added = lost_index.add([
+        (str(report.get('_id')), tags.get(str(report.get('_id')), digest), [str(report.get('_id'))], [vector],
+         blocking_keys(report))
+        for report, (digest, _, vector) in zip(reports, entries)
+    ])
+    embedding_store.flush()
+    log(f"🗂️ Indexed {added} lost report(s)", "STEP")
+    return added
+
+# Match found reports against their top-k indexed lost reports; with blocking
+# settings the top-k only holds lost reports the blocking rules keep
+def match_against_index(found_reports, threshold=0.6, top_k=DEFAULT_TOP_K, blocking=None):
+    allowed = [index_filter(lost_index, found, blocking) for found in found_reports] if blocking is not None else None
+    keys, scores = lost_index.search(embedding_matrix(found_reports), top_k, allowed)
+    matches, top = [], {}
+    for found, row_keys, row_scores in zip(found_reports, keys, scores):
+        found_id = str(found.get('_id'))
+        top[found_id] = [{'lost_id': k, 'score': round(float(v), 3)} for k, v in zip(row_keys, row_scores)]
+        for lost_id, score in zip(row_keys, row_scores):
+            if score >= threshold:
+                match_entry = {
+                    'lost_id': lost_id,
+                    'found_id': found_id,
+                    'score': round(float(score), 3),
+                    'matched_on': datetime.now().isoformat()
+                }
+                matches.append(match_entry)
+                log(f"✅ Match Found: {match_entry}", "SUCCESS")
+    return matches, top
 
 @app.route('/match-text', methods=['POST'])
 def match_text():
@@ -98,13 +268,73 @@ def match_text():
         lost = data.get('lost', [])
         found = data.get('found', [])
         log(f"📥 Received {len(lost)} lost and {len(found)} found reports for matching", "RECEIVE")
-        matches = match_reports(lost, found)
-        return jsonify({'matches': matches}), 200
+        include_scores = data.get('include_scores', False)
+        table = None
+        if 'lost' in data:
+            matches, top, scores = match_reports(lost, found, top_k=data.get('top_k'))
+            if include_scores:
+                table = ([str(r.get('_id')) for r in lost], [str(r.get('_id')) for r in found], scores)
+        else:
+            # No lost list: score against the top-k candidates from the lost-report index
+            matches, top = match_against_index(found, top_k=int(data.get('top_k') or DEFAULT_TOP_K),
+                                               blocking=data.get('blocking'))
+            if include_scores:
+                table = score_matrix.from_pairs(
+                    [(c['lost_id'], found_id, c['score']) for found_id, candidates in top.items() for c in candidates],
+                    found_ids=[str(r.get('_id')) for r in found])
+        embedding_store.flush()
+        response = {'matches': matches, 'model_version': EMBEDDING_VERSION}
+        if table is not None:
+            # Raw scores of every evaluated pair, including those below threshold
+            response['scores'] = score_matrix.encode(*table)
+        if top is not None:
+            response['top_k'] = top
+        return jsonify(response), 200
     except Exception as e:
         log(f"❌ Critical failure: {e}", "ERROR")
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/search-text', methods=['POST'])
+def search_text():
+    try:
+        data = request.get_json()
+        k = int(data.get('k', DEFAULT_TOP_K))
+        if data.get('found'):
+            query = embedding_matrix([data['found']])
+        else:
+            text = preprocess(data.get('text', ''))
+            query = get_model().encode([text], normalize_embeddings=True, convert_to_numpy=True)
+        keys, scores = lost_index.search(query, k)
+        results = [{'lost_id': key, 'score': round(float(score), 3)} for key, score in zip(keys[0], scores[0])]
+        return jsonify({'results': results}), 200
+    except Exception as e:
+        log(f"❌ Search failed: {e}", "ERROR")
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+register_index_routes(app, lost_index, index_reports)
+
+@app.route('/cache-stats', methods=['GET'])
+def get_cache_stats():
+    with _stats_lock:
+        stats = dict(cache_stats)
+    lookups = sum(stats.values())
+    stats.update({
+        'hit_rate': round((stats['memory_hits'] + stats['disk_hits']) / lookups, 4) if lookups else 0.0,
+        'memory_entries': len(memory_cache),
+        'disk_entries': len(embedding_store)
+    })
+    return jsonify(stats), 200
+
+@app.route('/health', methods=['GET'])
+def health():
+    status = startup_timer.report()
+    status['ready'] = _ready.is_set()
+    return jsonify(status), 200 if status['ready'] else 503
+
 if __name__ == '__main__':
+    if WARMUP_ON_START:
+        start_background_warmup()
     log("🔁 Text Matching Agent is listening on port 5001...", "INFO")
     app.run(port=5001)
@@ -0,0 +1,42 @@
+from functools import lru_cache
+import re
+import os
+
+# Fast, deterministic text preprocessing for report titles and descriptions.
+# The language is picked from the script of the letters (Arabic vs Latin),
+# tokens come from one compiled regex instead of the Punkt pipeline, and
+# results are memoized so unchanged text is never re-tokenized.
+
+PREPROCESS_VERSION = "script-regex-1"
+PREPROCESS_CACHE_SIZE = int(os.environ.get("TEXT_PREPROCESS_CACHE_SIZE", "50000"))
+
+ARABIC_LETTERS = re.compile('[\u0620-\u064A\u066E-\u06D3\u06FA-\u06FC\u0750-\u077F\u08A0-\u08C7\uFB50-\uFDFF\uFE70-\uFEFC]')
+LATIN_LETTERS = re.compile('[A-Za-z\u00C0-\u024F]')
+ARABIC_DIACRITICS = re.compile('[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED\u0640]')  # tashkeel and tatweel
+TOKEN = re.compile(r'[^\W_]+')
+
+# Stopword sets per language code, filled by the agent once NLTK data is available
+STOPWORDS = {}
+
+
+def set_stopwords(table):
+    STOPWORDS.clear()
+    STOPWORDS.update(table)
+    preprocess.cache_clear()
+
+
+# Majority script wins; text with no letters (or a tie) falls back to English
+def detect_language(text):
+    arabic = len(ARABIC_LETTERS.findall(text))
+    latin = len(LATIN_LETTERS.findall(text))
+    return 'ar' if arabic > latin else 'en'
+
+
+def tokenize(text):
+    return TOKEN.findall(ARABIC_DIACRITICS.sub('', text.lower()))
+
+
+@lru_cache(maxsize=PREPROCESS_CACHE_SIZE)
+def preprocess(text):
+    stop_words = STOPWORDS.get(detect_language(text), set())
+    return ' '.join(token for token in tokenize(text) if token not in stop_words)
@@ -0,0 +1,350 @@
+import numpy as np
+import threading
+import json
+import os
+
+# Vector indexes over L2-normalized embeddings, so inner product == cosine.
+# FlatIndex is exact; HNSWIndex is an approximate backend used when hnswlib
+# is installed. Both map string keys (report ids, image keys) to vectors and
+# persist themselves into a directory.
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+
+def normalize(vectors):
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def top_k(keys, scores, k):
+    order = np.argsort(-scores)[:k]
+    return [keys[i] for i in order], scores[order]
+
+
+class FlatIndex:
+    kind = "flat"
+
+    def __init__(self, dim):
+        self.dim = dim
+        self.lock = threading.RLock()
+        self.keys = []
+        self.positions = {}
+        self.matrix = np.zeros((0, dim), dtype=np.float32)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.positions
+
+    def all_keys(self):
+        with self.lock:
+            return list(self.keys)
+
+    def add(self, keys, vectors):
+        vectors = normalize(vectors)
+        with self.lock:
+            self.remove([k for k in keys if k in self.positions])
+            self.keys.extend(keys)
+            self.matrix = np.vstack([self.matrix, vectors])
+            self.positions = {k: i for i, k in enumerate(self.keys)}
+
+    def remove(self, keys):
+        with self.lock:
+            drop = [self.positions[k] for k in keys if k in self.positions]
+            if not drop:
+                return 0
+            keep = np.ones(len(self.keys), dtype=bool)
+            keep[drop] = False
+            self.matrix = self.matrix[keep]
+            self.keys = [k for k, kept in zip(self.keys, keep) if kept]
+            self.positions = {k: i for i, k in enumerate(self.keys)}
+            return len(drop)
+
+    def search(self, queries, k):
+        queries = normalize(queries)
+        with self.lock:
+            matrix, keys = self.matrix, self.keys
+        k = min(k, len(keys))
+        if k == 0:
+            return [[] for _ in range(len(queries))], np.zeros((len(queries), 0), dtype=np.float32)
+        scores = queries @ matrix.T
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        return [[keys[i] for i in row] for row in top], top_scores
+
+    # Exact top-k of one query among the given keys only
+    def search_within(self, query, keys, k):
+        query = normalize(query)[0]
+        with self.lock:
+            present = [key for key in keys if key in self.positions]
+            vectors = self.matrix[[self.positions[key] for key in present]]
+        return top_k(present, vectors @ query, k)
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        with self.lock:
+            np.save(os.path.join(directory, "vectors.npy"), self.matrix)
+            with open(os.path.join(directory, "keys.json"), "w", encoding="utf-8") as f:
+                json.dump({"kind": self.kind, "dim": self.dim, "keys": self.keys}, f)
+
+    def load(self, directory):
+        with open(os.path.join(directory, "keys.json"), "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        with self.lock:
+            self.keys = saved["keys"]
+            self.matrix = np.load(os.path.join(directory, "vectors.npy"))
+            self.positions = {k: i for i, k in enumerate(self.keys)}
+
+
+class HNSWIndex:
+    kind = "hnsw"
+
+    def __init__(self, dim, m=16, ef_construction=200, ef_search=64, initial_capacity=1024):
+        if hnswlib is None:
+            raise ImportError("hnswlib is required for the 'hnsw' index backend")
+        self.dim = dim
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.lock = threading.RLock()
+        self.labels = {}
+        self.keys = {}
+        self.next_label = 0
+        self.index = self._new_index(initial_capacity)
+
+    def _new_index(self, capacity):
+        index = hnswlib.Index(space="ip", dim=self.dim)
+        index.init_index(max_elements=capacity, ef_construction=self.ef_construction,
+                         M=self.m, allow_replace_deleted=True)
+        index.set_ef(self.ef_search)
+        return index
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __contains__(self, key):
+        return key in self.labels
+
+    def all_keys(self):
+        with self.lock:
+            return list(self.labels)
+
+    def add(self, keys, vectors):
+        vectors = normalize(vectors)
+        with self.lock:
+            self.remove([k for k in keys if k in self.labels])
+            needed = self.index.get_current_count() + len(keys)
+            if needed > self.index.get_max_elements():
+                self.index.resize_index(max(needed, 2 * self.index.get_max_elements()))
+            labels = np.arange(self.next_label, self.next_label + len(keys))
+            self.next_label += len(keys)
+            self.index.add_items(vectors, labels, replace_deleted=True)
+            for key, label in zip(keys, labels):
+                self.labels[key] = int(label)
+                self.keys[int(label)] = key
+
+    def remove(self, keys):
+        removed = 0
+        with self.lock:
+            for key in keys:
+                label = self.labels.pop(key, None)
+                if label is not None:
+                    self.index.mark_deleted(label)
+                    del self.keys[label]
+                    removed += 1
+        return removed
+
+    def search(self, queries, k):
+        queries = normalize(queries)
+        with self.lock:
+            k = min(k, len(self.labels))
+            if k == 0:
+                return [[] for _ in range(len(queries))], np.zeros((len(queries), 0), dtype=np.float32)
+            self.index.set_ef(max(self.ef_search, k))
+            labels, distances = self.index.knn_query(queries, k=k)
+            return [[self.keys[int(l)] for l in row] for row in labels], 1.0 - distances
+
+    # Exact top-k of one query among the given keys only
+    def search_within(self, query, keys, k):
+        query = normalize(query)[0]
+        with self.lock:
+            present = [key for key in keys if key in self.labels]
+            if not present:
+                return [], np.zeros(0, dtype=np.float32)
+            vectors = np.asarray(self.index.get_items([self.labels[key] for key in present]), dtype=np.float32)
+        return top_k(present, vectors @ query, k)
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        with self.lock:
+            self.index.save_index(os.path.join(directory, "hnsw.bin"))
+            with open(os.path.join(directory, "keys.json"), "w", encoding="utf-8") as f:
+                json.dump({"kind": self.kind, "dim": self.dim, "next_label": self.next_label,
+                           "labels": self.labels}, f)
+
+    def load(self, directory):
+        with open(os.path.join(directory, "keys.json"), "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        with self.lock:
+            self.index = hnswlib.Index(space="ip", dim=self.dim)
+            self.index.load_index(os.path.join(directory, "hnsw.bin"), allow_replace_deleted=True)
+            self.index.set_ef(self.ef_search)
+            self.labels = saved["labels"]
+            self.keys = {label: key for key, label in self.labels.items()}
+            self.next_label = saved["next_label"]
+
+
+# Filtered searches fetch this many times k hits before filtering
+SEARCH_OVERFETCH = int(os.environ.get("INDEX_SEARCH_OVERFETCH", "5"))
+
+
+INDEX_BACKENDS = {
+    "flat": FlatIndex,
+    "hnsw": HNSWIndex
+}
+
+
+def open_index(directory, dim, kind="flat"):
+    index = INDEX_BACKENDS[kind](dim)
+    keys_path = os.path.join(directory, "keys.json")
+    if os.path.isfile(keys_path):
+        with open(keys_path, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        if saved.get("kind") == kind and saved.get("dim") == dim:
+            index.load(directory)
+    return index
+
+
+# An index of reports where each report owns zero or more vectors (its keys),
+# an optional tag such as a text hash, so edited reports can be spotted, and
+# optional attributes (e.g. blocking keys) that searches can filter on.
+# The report registry is saved next to the index with the version of the
+# model that produced the vectors; a version change empties the index.
+class ReportIndex:
+    def __init__(self, directory, dim, kind="flat", version=None):
+        self.directory = directory
+        self.kind = kind
+        self.version = version
+        self.lock = threading.RLock()
+        self.index = open_index(directory, dim, kind)
+        self.reports = {}
+        self.owners = {}
+        self.discarded = False
+        self._load()
+
+    def _registry_path(self):
+        return os.path.join(self.directory, "reports.json")
+
+    def _load(self):
+        saved = {}
+        if os.path.isfile(self._registry_path()):
+            with open(self._registry_path(), "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        if saved.get("version") == self.version:
+            self.reports = saved.get("reports", {})
+            self.owners = {key: report_id for report_id, entry in self.reports.items() for key in entry["keys"]}
+        elif len(self.index):
+            self.index.remove(self.index.all_keys())
+            self.discarded = True
+
+    def __len__(self):
+        return len(self.reports)
+
+    def save(self):
+        with self.lock:
+            self.index.save(self.directory)
+            tmp_path = self._registry_path() + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": self.version, "reports": self.reports}, f)
+            os.replace(tmp_path, self._registry_path())
+
+    def reset(self, version):
+        with self.lock:
+            self.index.remove(self.index.all_keys())
+            self.reports.clear()
+            self.owners.clear()
+            self.version = version
+            self.save()
+
+    # reports holds (report_id, tag, keys, vectors, attributes); reports
+    # already in the index are replaced. Returns the number of vectors added.
+    def add(self, reports):
+        keys, vectors = [], []
+        with self.lock:
+            self.remove([report_id for report_id, _, _, _, _ in reports])
+            for report_id, tag, report_keys, report_vectors, attributes in reports:
+                self.reports[report_id] = {"tag": tag, "keys": list(report_keys), "attributes": attributes}
+                self.owners.update((key, report_id) for key in report_keys)
+                keys.extend(report_keys)
+                vectors.extend(report_vectors)
+            if keys:
+                self.index.add(keys, np.vstack(vectors))
+        return len(keys)
+
+    def remove(self, report_ids):
+        with self.lock:
+            keys = [k for report_id in report_ids for k in (self.reports.pop(report_id, None) or {}).get("keys", [])]
+            for key in keys:
+                self.owners.pop(key, None)
+            return self.index.remove(keys)
+
+    # Stored attributes of each report ({} when unknown)
+    def attributes(self, report_ids):
+        with self.lock:
+            return [(self.reports.get(report_id) or {}).get("attributes") or {} for report_id in report_ids]
+
+    # Drop reports missing from active ({report_id: tag or None}) and return
+    # the ids that are new or whose tag changed, plus the dropped ids
+    def sync(self, active):
+        with self.lock:
+            stale = [report_id for report_id in self.reports if report_id not in active]
+            self.remove(stale)
+            missing = sorted(
+                report_id for report_id, tag in active.items()
+                if report_id not in self.reports or (tag and self.reports[report_id]["tag"] != tag)
+            )
+            if stale:
+                self.save()
+        return missing, stale
+
+    # allowed optionally holds one filter per query (None for no restriction)
+    # mapping report ids to a mask of the ones the query may return.
+    # Filtered queries take the allowed hits among SEARCH_OVERFETCH * k from
+    # the index; when fewer than k survive, the query is scored exactly
+    # against the vectors of every allowed report instead.
+    def search(self, queries, k, allowed=None):
+        if allowed is None or all(keep is None for keep in allowed):
+            return self.index.search(queries, k)
+        queries = normalize(queries)
+        hit_keys, hit_scores = self.index.search(queries, k * SEARCH_OVERFETCH)
+        keys, scores = [], []
+        for query, row_keys, row_scores, keep in zip(queries, hit_keys, hit_scores, allowed):
+            if keep is not None and row_keys:
+                with self.lock:
+                    owners = [self.owners.get(key) for key in row_keys]
+                mask = np.asarray(keep(owners), dtype=bool)
+                fetched = len(row_keys)
+                row_keys, row_scores = [key for key, kept in zip(row_keys, mask) if kept], row_scores[mask]
+                if len(row_keys) < k and fetched < len(self.index):
+                    row_keys, row_scores = self._search_allowed(query, keep, k)
+            keys.append(row_keys[:k])
+            scores.append(row_scores[:k])
+        return keys, scores
+
+    def _search_allowed(self, query, keep, k):
+        with self.lock:
+            report_ids = list(self.reports)
+        report_ids = [report_id for report_id, kept in zip(report_ids, keep(report_ids)) if kept]
+        with self.lock:
+            candidate_keys = [key for report_id in report_ids for key in self.reports.get(report_id, {}).get("keys", [])]
+        return self.index.search_within(query, candidate_keys, k)
+
+    def stats(self):
+        return {"backend": self.kind, "reports": len(self.reports), "vectors": len(self.index), "version": self.version}